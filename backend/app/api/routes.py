@@ -1,45 +1,139 @@
-from typing import List, Optional
-from fastapi import APIRouter, HTTPException
+from functools import lru_cache
+from typing import Any, List, Optional
+from uuid import uuid4
+from fastapi import APIRouter, BackgroundTasks, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from ..services.llm.query_processor import QueryProcessor
+from ..services.llm.query_processor import QueryProcessor, ERROR_ANSWER, FALLBACK_ANSWERS, question_cache_key
+from ..services.llm.query_batcher import QueryBatcher
 from ..services.nba.nba_api_client import NBAApiClient
 
 from ..core.settings import settings
+from ..core.cache import cache
 
 import logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 storage = settings.storage
+nba_client = NBAApiClient(storage=storage)
+
+# Answers are generated with temperature=0, so repeated questions can be served from cache
+QUERY_CACHE_TTL = 3600
+
+# Setup job statuses live in the cache, only shared by every worker with CACHE_BACKEND=redis (or file, on one host)
+SETUP_JOB_TTL = 24 * 3600
 
 @router.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 class NBAQueryRequest(BaseModel):
     question: str = Field(..., description="Natural language question about NBA data")
 
+@lru_cache(maxsize=1)
+def get_query_processor() -> QueryProcessor:
+    """ Shared processor, built on first use so the LLM client and its HTTP pool are reused across requests """
+    return QueryProcessor(storage=storage, nba_client=nba_client)
+
+async def answer_questions(questions: List[str]) -> List[Any]:
+    """ Answer a batch of questions with one LLM batch call per stage """
+    processor = get_query_processor()
+    return await processor.abatch_query(questions)
+
+query_batcher = QueryBatcher(handler=answer_questions)
+
 @router.post("/query")
-def process_nba_query(request: NBAQueryRequest):
+async def process_nba_query(request: NBAQueryRequest):
     try: 
-        processor = QueryProcessor(storage=storage)
-        answer = processor.query(request.question)
+        key = question_cache_key("query", request.question)
+        answer = await cache.aget(key)
+        if answer is not None:
+            logger.info("Serving NBA query answer from cache")
+            return {"answer": answer }
+
+        answer = await query_batcher.submit(request.question, key=key)
+        if answer not in FALLBACK_ANSWERS:
+            await cache.aset(key, answer, ttl=QUERY_CACHE_TTL)
 
         return {"answer": answer }
     except Exception as e:
         logger.error(f"Error in NBA query endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     
+def sse_event(data: str) -> str:
+    """ Format a chunk of text as a server-sent event, one data field per line """
+    return "".join(f"data: {line}\n" for line in data.split("\n")) + "\n"
+
+@router.post("/query/stream")
+async def stream_nba_query(request: NBAQueryRequest):
+    """ Same as /query but streams the answer as server-sent events while the LLM generates it """
+    key = question_cache_key("query", request.question)
+    cached = await cache.aget(key)
+
+    try:
+        processor = None if cached is not None else get_query_processor()
+    except Exception as e:
+        logger.error(f"Error in NBA query stream endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        if cached is not None:
+            logger.info("Serving NBA query answer from cache")
+            yield sse_event(cached)
+            return
+
+        chunks = []
+        try:
+            async for chunk in processor.astream_query(request.question):
+                chunks.append(chunk)
+                yield sse_event(chunk)
+        except Exception as e:
+            # Headers are already sent, report the failure in-band
+            logger.error(f"Error streaming NBA query answer: {e}")
+            yield sse_event(ERROR_ANSWER)
+            return
+
+        answer = "".join(chunks)
+        if answer not in FALLBACK_ANSWERS:
+            await cache.aset(key, answer, ttl=QUERY_CACHE_TTL)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
 class SetupDatasetRequest(BaseModel):
     seasons: Optional[List[str]] = Field(default=None, description="List of seasons like ['2022-23', '2023-24']. If None, uses default seasons.")
 
+def setup_job_key(job_id: str) -> str:
+    return f"setup-job:{job_id}"
+
+def run_setup_job(job_id: str, seasons: Optional[List[str]]):
+    """ Run the dataset setup and record its progress, executed in the background after the request returns """
+    job = {"job_id": job_id, "status": "running", "seasons": seasons}
+    cache.set(setup_job_key(job_id), job, ttl=SETUP_JOB_TTL)
+
+    success = nba_client.setup_nba_dataset(seasons=seasons)
+
+    job = {**job, "status": "completed" if success else "failed"}
+    cache.set(setup_job_key(job_id), job, ttl=SETUP_JOB_TTL)
+    logger.info(f"NBA dataset setup job {job_id} {job['status']}")
+
 # Later this will be setup as a scheduled task or admin-triggered action
-@router.post("/setup-dataset")
-def setup_nba_dataset(request: SetupDatasetRequest):
-    client = NBAApiClient(storage=storage)
-    success = client.setup_nba_dataset(seasons=request.seasons)
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to setup NBA dataset")
-
-    return {"status": "NBA dataset setup completed successfully"}
+@router.post("/setup-dataset", status_code=202)
+async def setup_nba_dataset(request: SetupDatasetRequest, background_tasks: BackgroundTasks):
+    """ Start the dataset setup in the background, poll /setup-dataset/{job_id} for its status """
+    job_id = str(uuid4())
+    await cache.aset(setup_job_key(job_id), {"job_id": job_id, "status": "pending", "seasons": request.seasons}, ttl=SETUP_JOB_TTL)
+
+    # Sync task, so Starlette runs the blocking collection in its threadpool
+    background_tasks.add_task(run_setup_job, job_id, request.seasons)
+
+    return {"status": "accepted", "job_id": job_id}
+
+@router.get("/setup-dataset/{job_id}")
+async def get_setup_dataset_status(job_id: str):
+    job = await cache.aget(setup_job_key(job_id))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Setup job {job_id} not found")
+
+    return job
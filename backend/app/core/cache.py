@@ -1,45 +1,374 @@
+import asyncio
+import hashlib
+import math
+import os
+import pickle
 import threading
 import time
-from typing import Any, Dict, Optional, Tuple
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from cachetools import TLRUCache
 
-class Cache:
-    """ Simple thread-safe in-memory global cache with optional TTL support."""
+from .settings import settings
 
-    def __init__(self):
-        self._lock = threading.Lock()
-        self._store: Dict[str, Tuple[Any, Optional[float]]] = {}
+import logging
+logger = logging.getLogger(__name__)
+
+def _time_to_use(key: str, item: Tuple[Any, Optional[float]], now: float) -> float:
+    """ Expiry for a cached (value, ttl) pair, entries without a TTL never expire """
+    _, ttl = item
+    return math.inf if ttl is None else now + ttl
+
+class BaseCache(ABC):
+    """
+    Abstract base class for cache backends.
+    """
+
+    # Striped per-key locks, shared by every in-process backend
+    _key_locks = [threading.RLock() for _ in range(64)]
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        pass
+
+    @abstractmethod
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def delete(self, key: str):
+        pass
+
+    @abstractmethod
+    def clear(self):
+        pass
+
+    def has(self, key: str) -> bool:
+        """ Check if a key exists and is not expired. """
+        return self.get(key, default=None) is not None
+
+    async def aget(self, key: str, default: Any = None) -> Optional[Any]:
+        """ Async `get`, run in a worker thread so disk or network backends don't block the event loop """
+        return await asyncio.to_thread(self.get, key, default)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[int] = None):
+        """ Async `set`, run in a worker thread so disk or network backends don't block the event loop """
+        await asyncio.to_thread(self.set, key, value, ttl)
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """ Hold a lock for `key` so a single caller fills it, this process only unless the backend is shared """
+        with self._key_locks[hash(key) % len(self._key_locks)]:
+            yield
+
+    def get_or_set(self, key: str, loader: Callable[[], Any], ttl: Optional[int] = None) -> Any:
+        """ Value of `key`, computed with `loader` and stored on a miss. \n
+            Concurrent misses for the same key wait for the first caller instead of all running `loader`.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self.lock(key):
+            # Filled while this caller waited for the lock
+            value = self.get(key)
+            if value is None:
+                value = loader()
+                self.set(key, value, ttl)
+        return value
+
+class Cache(BaseCache):
+    """ Simple thread-safe in-memory global cache with optional TTL support. \n
+        Bounded to `maxsize` entries (least recently used are evicted first), spread over sharded locks.
+    """
+
+    def __init__(self, maxsize: int = 10_000, shards: int = 16, timer: Callable[[], float] = time.monotonic):
+        # Never more shards than entries, and the remainder goes one apiece to the first shards so the total is maxsize
+        shards = max(1, min(shards, maxsize))
+        shard_size, remainder = divmod(max(1, maxsize), shards)
+        self._shards: List[Tuple[threading.Lock, TLRUCache]] = [
+            (threading.Lock(), TLRUCache(maxsize=shard_size + (1 if index < remainder else 0), ttu=_time_to_use, timer=timer))
+            for index in range(shards)
+        ]
+        self._hits = [0] * shards
+        self._misses = [0] * shards
+
+    def _shard_index(self, key: str) -> int:
+        return hash(key) % len(self._shards)
 
     def set(self, key: str, value: Any, ttl: Optional[int] = None):
         """ Set a value in the cache with an optional TTL (in seconds). """
-        expiry = None if ttl is None else (time.time() + float(ttl))
-        with self._lock:
-            self._store[key] = (value, expiry)
-    
+        lock, store = self._shards[self._shard_index(key)]
+        with lock:
+            store[key] = (value, None if ttl is None else float(ttl))
+
     def get(self, key: str, default: Any = None) -> Optional[Any]:
         """ Get a value from the cache. Returns None if not found or expired. """
-        with self._lock:
-            item = self._store.get(key)
+        index = self._shard_index(key)
+        lock, store = self._shards[index]
+        # Lookups update LRU order, so reads need the shard lock too
+        with lock:
+            item = store.get(key)
             if item is None:
+                self._misses[index] += 1
                 return default
-            value, expiry = item
-            if expiry is not None and time.time() > expiry:
-                del self._store[key]
-                return default
-            return value
-    
-    def has(self, key: str) -> bool:
-        """ Check if a key exists and is not expired. """
-        return self.get(key, default=None) is not None
-    
+            self._hits[index] += 1
+            return item[0]
+
+    def delete(self, key: str):
+        """ Delete a key from the cache. """
+        lock, store = self._shards[self._shard_index(key)]
+        with lock:
+            store.pop(key, None)
+
+    def clear(self):
+        """ Clear the entire cache. """
+        for lock, store in self._shards:
+            with lock:
+                store.clear()
+
+    # In memory, a lookup is cheaper than the hop to a worker thread
+
+    async def aget(self, key: str, default: Any = None) -> Optional[Any]:
+        return self.get(key, default)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[int] = None):
+        self.set(key, value, ttl)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Hit/miss counters and current number of entries, to observe the hit rate """
+        return {
+            "hits": sum(self._hits),
+            "misses": sum(self._misses),
+            "size": sum(len(store) for _, store in self._shards),
+        }
+
+class FileCache(BaseCache):
+    """
+    Cache persisted as one pickle file per key, shared by workers on the same host and kept across restarts.
+    """
+
+    # Lock files older than this were left by a crashed worker and are taken over
+    LOCK_TTL = 60
+    LOCK_POLL_INTERVAL = 0.1
+
+    def __init__(self, directory: str = "data/cache"):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, extension: str = "pkl") -> str:
+        return os.path.join(self.directory, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.{extension}")
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """ Set a value in the cache with an optional TTL (in seconds). """
+        expiry = None if ttl is None else time.time() + float(ttl)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump((value, expiry), f, protocol=pickle.HIGHEST_PROTOCOL)
+            # Atomic rename so concurrent readers never see a partial file
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.error(f"Failed to write cache entry to {path}: {e}")
+            # Don't leave the partial file behind
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
+        """ Get a value from the cache. Returns None if not found or expired. """
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value, expiry = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            logger.error(f"Failed to read cache entry from {path}: {e}")
+            return default
+
+        if expiry is not None and time.time() > expiry:
+            self.delete(key)
+            return default
+        return value
+
     def delete(self, key: str):
         """ Delete a key from the cache. """
-        with self._lock:
-            if key in self._store:
-                del self._store[key]
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
 
     def clear(self):
         """ Clear the entire cache. """
-        with self._lock:
-            self._store.clear()
+        for filename in os.listdir(self.directory):
+            if filename.endswith((".pkl", ".tmp")):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except FileNotFoundError:
+                    pass
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """ Hold a lock for `key` across every worker sharing this directory (exclusive lock file), after the in-process one """
+        with super().lock(key):
+            lock_path = self._path(key, "lock")
+            token = uuid.uuid4().hex.encode()
+            acquired = self._acquire_lock(lock_path, token)
+            try:
+                yield
+            finally:
+                if acquired:
+                    self._release_lock(lock_path, token)
+
+    def _acquire_lock(self, lock_path: str, token: bytes) -> bool:
+        """ Wait for the lock file until it goes stale, if the filesystem fails the caller goes ahead unlocked """
+        deadline = time.monotonic() + self.LOCK_TTL
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                with os.fdopen(fd, "wb") as f:
+                    f.write(token)
+                return True
+            except FileExistsError:
+                pass
+            except OSError as e:
+                logger.error(f"Failed to take cache lock {lock_path}: {e}")
+                return False
+            try:
+                if time.time() - os.path.getmtime(lock_path) >= self.LOCK_TTL:
+                    # Left behind by a worker that died holding it
+                    os.remove(lock_path)
+                    continue
+            except FileNotFoundError:
+                continue
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for cache lock {lock_path}")
+                return False
+            time.sleep(self.LOCK_POLL_INTERVAL)
+
+    def _release_lock(self, lock_path: str, token: bytes):
+        try:
+            # Only drop our own lock, it may have gone stale and been taken by another worker
+            with open(lock_path, "rb") as f:
+                owned = f.read() == token
+            if owned:
+                os.remove(lock_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to release cache lock {lock_path}: {e}")
+
+class RedisCache(BaseCache):
+    """
+    Redis-backed cache shared by every worker, TTLs are enforced by Redis itself.
+    """
+
+    # Cross-worker locks expire on their own so a crashed holder can't block the key forever
+    LOCK_TTL = 60
+    LOCK_POLL_INTERVAL = 0.1
+
+    def __init__(self, url: str = "redis://localhost:6379/0", client: Any = None, namespace: str = "nba-cache"):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.namespace = namespace
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """ Set a value in the cache with an optional TTL (in seconds). """
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if ttl is None:
+                self.client.set(self._key(key), payload)
+            else:
+                self.client.set(self._key(key), payload, ex=int(ttl))
+        except Exception as e:
+            logger.error(f"Failed to write cache entry to Redis: {e}")
+
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
+        """ Get a value from the cache. Returns None if not found or expired. """
+        try:
+            payload = self.client.get(self._key(key))
+        except Exception as e:
+            logger.error(f"Failed to read cache entry from Redis: {e}")
+            return default
+        if payload is None:
+            return default
+        try:
+            return pickle.loads(payload)
+        except Exception as e:
+            logger.error(f"Failed to unpickle cache entry from Redis: {e}")
+            return default
+
+    def delete(self, key: str):
+        """ Delete a key from the cache. """
+        try:
+            self.client.delete(self._key(key))
+        except Exception as e:
+            logger.error(f"Failed to delete cache entry from Redis: {e}")
+
+    @contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """ Hold a lock for `key` across every worker sharing this Redis (SET NX), after the in-process one """
+        with super().lock(key):
+            lock_key = self._key(f"lock:{key}")
+            token = uuid.uuid4().hex.encode()
+            acquired = self._acquire_lock(lock_key, token)
+            try:
+                yield
+            finally:
+                if acquired:
+                    self._release_lock(lock_key, token)
+
+    def _acquire_lock(self, lock_key: str, token: bytes) -> bool:
+        """ Wait for the lock until it expires, if Redis fails the caller goes ahead unlocked """
+        deadline = time.monotonic() + self.LOCK_TTL
+        while True:
+            try:
+                if self.client.set(lock_key, token, nx=True, ex=self.LOCK_TTL):
+                    return True
+            except Exception as e:
+                logger.error(f"Failed to take cache lock in Redis: {e}")
+                return False
+            if time.monotonic() >= deadline:
+                logger.warning(f"Timed out waiting for cache lock {lock_key}")
+                return False
+            time.sleep(self.LOCK_POLL_INTERVAL)
+
+    def _release_lock(self, lock_key: str, token: bytes):
+        try:
+            # Only drop our own lock, it may have expired and been taken by another worker
+            if self.client.get(lock_key) == token:
+                self.client.delete(lock_key)
+        except Exception as e:
+            logger.error(f"Failed to release cache lock in Redis: {e}")
+
+    def clear(self):
+        """ Clear every key in this cache's namespace. """
+        try:
+            keys = list(self.client.scan_iter(match=f"{self.namespace}:*"))
+            if keys:
+                self.client.delete(*keys)
+        except Exception as e:
+            logger.error(f"Failed to clear cache entries from Redis: {e}")
+
+def create_cache() -> BaseCache:
+    """ Returns the configured cache backend based on env var """
+    backend = settings.get_env_var("CACHE_BACKEND", "memory").lower()
+    if backend == "redis":
+        return RedisCache(url=settings.get_env_var("REDIS_URL", "redis://localhost:6379/0"))
+    elif backend == "file":
+        return FileCache(directory=settings.get_env_var("CACHE_DIR", "data/cache"))
+    else:
+        return Cache(maxsize=int(settings.get_env_var("CACHE_MAX_ENTRIES", "10000")))
 
-cache = Cache()
+cache = create_cache()
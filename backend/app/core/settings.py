@@ -1,11 +1,11 @@
 import os
 from enum import Enum
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 from dotenv import load_dotenv
 from datetime import date
+from functools import cached_property, lru_cache
 
-from ..services.storage.s3_storage import S3Storage
 from ..services.storage.local_storage import LocalStorage
 
 import logging
@@ -48,34 +48,87 @@ class Settings:
     
     def get_env_var(self, var_name: str, default: str = None) -> str:
         return os.getenv(var_name, default)
+
+    @property
+    def llm_provider(self) -> str:
+        """ Read on every call so changing LLM_PROVIDER takes effect, the clients themselves are cached per provider """
+        return self.get_env_var("LLM_PROVIDER", "openai").lower()
+
+    # Values below are read from the environment once per process
+
+    @cached_property
+    def storage_type(self) -> str:
+        return self.get_env_var("STORAGE_TYPE", "local").lower()
+
+    @cached_property
+    def save_formats(self) -> List[str]:
+        """ Formats datasets are saved in, comma separated (e.g. "parquet,json") """
+        formats = self.get_env_var("STORAGE_SAVE_FORMATS", "parquet")
+        return [file_format.strip().lower() for file_format in formats.split(",") if file_format.strip()]
+
+    @cached_property
+    def s3_data_bucket(self) -> str:
+        """ S3 bucket name for the current environment """
+        bucket_name = self.get_env_var("S3_NBA_DATA_BUCKET_NAME", "nba-analytics-data")
+        return f"{bucket_name}-{self.environment.value}"
+
+    @cached_property
+    def openai_api_key(self) -> str:
+        return self.get_env_var("OPENAI_API_KEY")
+
+    @cached_property
+    def anthropic_api_key(self) -> str:
+        return self.get_env_var("ANTHROPIC_API_KEY")
+
+    @cached_property
+    def mistral_api_key(self) -> str:
+        return self.get_env_var("MISTRAL_API_KEY")
+
+    @cached_property
+    def google_api_key(self) -> str:
+        return self.get_env_var("GOOGLE_API_KEY")
+
+    @cached_property
+    def ollama_base_url(self) -> str:
+        return self.get_env_var("OLLAMA_BASE_URL", "http://localhost:11434")
     
     def __create_storage(self):
         """ Returns the configured storage service based on env var """
-        storage_provider = self.get_env_var("STORAGE_TYPE", "local").lower()
-        if storage_provider == "s3":
-            s3_bucket = NBASettings.get_s3_data_bucket()
-            return S3Storage(s3_bucket)
+        if self.storage_type == "s3":
+            # Imported here so boto3 is only loaded when S3 storage is configured
+            from ..services.storage.s3_storage import S3Storage
+            return S3Storage(self.s3_data_bucket, formats=self.save_formats)
         else:
-            return LocalStorage(base_directory="data")
+            return LocalStorage(base_directory="data", formats=self.save_formats)
         
 class NBASettings:
     """
     NBA-specific settings
     """
-    # For now this is hardcoded, but could be made dynamic in the future
-    DEFAULT_SEASON: str = ''
+    # Number of recent seasons collected and offered by default
+    DEFAULT_NUM_SEASONS = 3
 
-    # Same here
-    DEFAULT_SEASONS_LIST: List[str] = []
+    @property
+    def DEFAULT_SEASON(self) -> str:
+        """ Current season, computed on access so a long running process rolls over with the calendar """
+        return self.get_current_season()
 
-    def __init__(self):
-        self.DEFAULT_SEASON = self.get_current_season()
-        self.DEFAULT_SEASONS_LIST = self.get_season_list(num_seasons=3)
+    @property
+    def DEFAULT_SEASONS_LIST(self) -> List[str]:
+        """ The DEFAULT_NUM_SEASONS most recent seasons, current first """
+        return self.get_season_list(num_seasons=self.DEFAULT_NUM_SEASONS)
 
     @staticmethod
-    def get_current_season() -> str:
+    def get_current_season(day_ordinal: Optional[int] = None) -> str:
         """ Get the current NBA season in format '2023-24' """
-        today = date.today()
+        day_ordinal = day_ordinal or date.today().toordinal()
+        return NBASettings._season_for_day(day_ordinal)
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _season_for_day(day_ordinal: int) -> str:
+        """ Season for a given day, cached per day so it is only computed once per date """
+        today = date.fromordinal(day_ordinal)
         year = today.year
         month = today.month
 
@@ -91,11 +144,17 @@ class NBASettings:
         return f"{start_year}-{str(end_year)[-2:]}"
 
     @staticmethod
-    def get_season_list(num_seasons: int = 5) -> List[str]:
+    def get_season_list(num_seasons: int = 5, current_season: Optional[str] = None) -> List[str]:
         """
-        Return a list of the most recent `num_years` seasons including current.
+        Return a list of the most recent `num_years` seasons including current. \n
+        `current_season` defaults to today's season.
         """
-        current_season = NBASettings.get_current_season()
+        current_season = current_season or NBASettings.get_current_season()
+        return list(NBASettings._season_list_for(current_season, num_seasons))
+
+    @staticmethod
+    @lru_cache(maxsize=8)
+    def _season_list_for(current_season: str, num_seasons: int) -> Tuple[str, ...]:
         start_year = int(current_season.split('-')[0])
 
         seasons = []
@@ -104,13 +163,12 @@ class NBASettings:
             season_end = season_start + 1
             seasons.append(f"{season_start}-{str(season_end)[-2:]}")
 
-        return seasons
+        return tuple(seasons)
 
     @staticmethod
     def get_s3_data_bucket() -> str:
         """ Get S3 bucket name based on environment """
-        bucket_name = settings.get_env_var("S3_NBA_DATA_BUCKET_NAME", "nba-analytics-data")
-        return f"{bucket_name}-{settings.environment.value}"
+        return settings.s3_data_bucket
 
 settings = Settings()
 nba_settings = NBASettings()
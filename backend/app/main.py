@@ -1,11 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from app.api import routes
 
 app = FastAPI(
     title="NBA Analytics API",
     description="Backend for NBA natural language stats queries",
-    version="0.1.0"
+    version="0.1.0",
+    default_response_class=ORJSONResponse,
 )
 
 app.add_middleware(
@@ -16,6 +19,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Small responses (health checks, short answers) aren't worth the compression overhead.
+# Server-sent event streams are excluded by the middleware so they still flush chunk by chunk
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 
 app.include_router(routes.router, prefix="/api/v1")
 
@@ -1,48 +1,90 @@
+from __future__ import annotations
+
 import logging
-from langchain_openai import ChatOpenAI
-from langchain_anthropic import ChatAnthropic
-from langchain_mistralai import ChatMistralAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_ollama import ChatOllama
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+from langchain_core.messages import SystemMessage
 from ...core.settings import settings
 
+# Only needed for annotations, the provider packages import it when the model is first built
+if TYPE_CHECKING:
+    from langchain_core.language_models.chat_models import BaseChatModel
+
 logger = logging.getLogger(__name__)
 
 # For now use the env var to set the LLM provider later there will be a config
-def get_llm():
+def get_provider() -> str:
+    """ Return the configured LLM provider name, defaults to openai """
+    return settings.llm_provider
+
+def cacheable_system_message(content: str, provider: Optional[str] = None) -> SystemMessage:
+    """ Build a system message the provider (the configured one by default) can cache as a prompt prefix. \n
+        OpenAI caches identical prefixes automatically, Anthropic needs an explicit cache_control marker.
+    """
+    if (provider or get_provider()) == "anthropic":
+        return SystemMessage(content=[{"type": "text", "text": content, "cache_control": {"type": "ephemeral"}}])
+    return SystemMessage(content=content)
+
+def get_llm() -> BaseChatModel:
     """ Return LLM client based on provider env var. \n
         Defaults to openai 
     """
-    provider = settings.get_env_var("LLM_PROVIDER", "openai").lower()
-    if provider == "openai":
-        return ChatOpenAI(
-            model = "gpt-4o-mini",
-            temperature = 0,
-            api_key = settings.get_env_var("OPENAI_API_KEY"),
-        )
-    elif provider == "anthropic":
-        return ChatAnthropic(
-            model = "claude-3-5-sonnet-20241022",
-            temperature = 0,
-            api_key = settings.get_env_var("ANTHROPIC_API_KEY"),
-        )
-    elif provider == "mistral":
-        return ChatMistralAI(
-            model = "mistral-small-latest",
-            temperature = 0,
-            api_key = settings.get_env_var("MISTRAL_API_KEY"),
-        )
-    elif provider == "google":
-        return ChatGoogleGenerativeAI(
-            model = "gemini-2.5-flash",
-            temperature = 0,
-            api_key = settings.get_env_var("GOOGLE_API_KEY"),
-        )
-    elif provider == "ollama":
-        return ChatOllama(
-            model = "llama3.1",
-            temperature = 0,
-            base_url = settings.get_env_var("OLLAMA_BASE_URL", "http://localhost:11434"),
-        )
-    else:
+    return _create_llm(get_provider())
+
+# Each factory imports its provider package on first use, so only the configured one is loaded
+
+def _create_openai() -> BaseChatModel:
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model = "gpt-4o-mini",
+        temperature = 0,
+        api_key = settings.openai_api_key,
+    )
+
+def _create_anthropic() -> BaseChatModel:
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(
+        model = "claude-3-5-sonnet-20241022",
+        temperature = 0,
+        api_key = settings.anthropic_api_key,
+    )
+
+def _create_mistral() -> BaseChatModel:
+    from langchain_mistralai import ChatMistralAI
+    return ChatMistralAI(
+        model = "mistral-small-latest",
+        temperature = 0,
+        api_key = settings.mistral_api_key,
+    )
+
+def _create_google() -> BaseChatModel:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(
+        model = "gemini-2.5-flash",
+        temperature = 0,
+        api_key = settings.google_api_key,
+    )
+
+def _create_ollama() -> BaseChatModel:
+    from langchain_ollama import ChatOllama
+    return ChatOllama(
+        model = "llama3.1",
+        temperature = 0,
+        base_url = settings.ollama_base_url,
+    )
+
+LLM_PROVIDERS: Dict[str, Callable[[], BaseChatModel]] = {
+    "openai": _create_openai,
+    "anthropic": _create_anthropic,
+    "mistral": _create_mistral,
+    "google": _create_google,
+    "ollama": _create_ollama,
+}
+
+@lru_cache(maxsize=None)
+def _create_llm(provider: str) -> BaseChatModel:
+    """ Build the client once per provider so its HTTP connection pool is reused across calls """
+    factory = LLM_PROVIDERS.get(provider)
+    if factory is None:
         raise ValueError(f"Unsupported LLM provider: {provider}")
+    return factory()
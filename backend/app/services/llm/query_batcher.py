@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+BatchHandler = Callable[[List[str]], Awaitable[List[Any]]]
+
+class QueryBatcher:
+    """
+    Coalesces concurrent questions into micro-batches handed to a single handler call. \n
+    A batch is flushed after `max_wait_ms` or once `max_batch_size` questions are queued. \n
+    Identical questions already in flight share the same result instead of being queued twice.
+    """
+
+    def __init__(self, handler: BatchHandler, max_batch_size: int = 8, max_wait_ms: int = 20):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def submit(self, question: str, key: Optional[str] = None) -> Any:
+        """ Queue a question and wait for its answer. `key` identifies duplicate questions (defaults to the question) """
+        self._ensure_worker()
+        key = key or question
+
+        future = self._pending.get(key)
+        if future is None:
+            future = self._loop.create_future()
+            self._pending[key] = future
+            self._queue.put_nowait((key, question, future))
+        else:
+            logger.info("Coalescing duplicate in-flight question")
+
+        # Shield so a cancelled caller does not cancel the result shared with other callers
+        return await asyncio.shield(future)
+
+    def _ensure_worker(self):
+        """ Start the drain loop lazily, restarting it if the running event loop changed """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._worker is not None and not self._worker.done():
+            return
+
+        self._loop = loop
+        self._queue = asyncio.Queue()
+        self._pending = {}
+        self._worker = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - self._loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # Process in the background so the next batch can start filling right away
+            task = self._loop.create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch: List[Tuple[str, str, asyncio.Future]]):
+        questions = [question for _, question, _ in batch]
+        logger.info(f"Processing batch of {len(questions)} questions")
+
+        try:
+            results = await self.handler(questions)
+            if len(results) != len(batch):
+                raise ValueError(f"Batch handler returned {len(results)} results for {len(batch)} questions")
+        except Exception as e:
+            logger.error(f"Error processing question batch: {e}")
+            results = [e] * len(batch)
+        except BaseException:
+            # Cancelled (or interrupted) mid-batch, cancel the futures so their callers and any later duplicates don't wait forever
+            for key, _, future in batch:
+                self._pending.pop(key, None)
+                future.cancel()
+            raise
+
+        for (key, _, future), result in zip(batch, results):
+            self._pending.pop(key, None)
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
@@ -1,19 +1,35 @@
+import asyncio
+import hashlib
+import orjson
 import pandas as pd
-import json
 import logging
-from typing import Dict, Any, Generator, List, Optional
-from langchain.schema import HumanMessage, SystemMessage
-from pydantic import BaseModel, Field
+from typing import Dict, Any, AsyncIterator, Callable, Iterator, List, Optional, Tuple, TypeVar, Union
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
+from functools import lru_cache
 
-from ..nba.nba_api_client import NBAApiClient
-from .llm_factory import get_llm
+from ..nba.nba_api_client import NBAApiClient, SHOT_STAT_FAMILIES, STATS_DATASETS, STATS_TYPE_SUFFIXES, stat_code
+from .llm_factory import cacheable_system_message, get_llm, get_provider
 from ..storage.base_storage import BaseStorage
-from ...core.settings import nba_settings
+from ...core.settings import nba_settings, NBASettings
+from ...core.cache import cache
 
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+NO_DATA_ANSWER = "No relevant NBA data found to answer your question."
+ERROR_ANSWER = "Sorry, I encountered an error while generating the answer."
+
+# Answers that reflect a missing dataset or a failure, not worth caching
+FALLBACK_ANSWERS = (NO_DATA_ANSWER, ERROR_ANSWER)
+
+# Analyses are extracted with temperature=0, so the same question always maps to the same analysis
+ANALYSIS_CACHE_TTL = 24 * 3600
+
 class QueryIntent(str, Enum):
     PLAYER_STATS = "player_stats"
     PLAYER_COMPARISON = "player_comparison"
@@ -45,17 +61,132 @@ class QueryAnalysis(BaseModel):
     comparison_type: Optional[ComparisonType] = Field(default=None, description="Type of comparison if applicable")
     top_n: int = Field(default=10, description="Number of top performers if applicable")
 
+    @model_validator(mode="after")
+    def default_to_current_season(self) -> "QueryAnalysis":
+        if not self.seasons:
+            self.seasons = [nba_settings.DEFAULT_SEASON]
+        return self
+
+# Rows of data sent to the LLM along with the question
+ANSWER_SAMPLE_ROWS = 10
+# Stats are stored as float32, rounding keeps its representation noise (25.2999992) out of the prompt
+ANSWER_FLOAT_PRECISION = 3
+
+# Stat used to rank top performers when the question does not name one
+DEFAULT_TOP_STAT = "points"
+
+# Columns that identify a row, always part of the data sent to the LLM
+IDENTITY_COLUMNS = ("PLAYER_NAME", "TEAM_NAME", "TEAM_ABBREVIATION", "season")
+
+
+@lru_cache(maxsize=256)
+def select_answer_columns(columns: Tuple[str, ...], stats: Tuple[str, ...], stats_type: str) -> Tuple[Tuple[str, ...], str]:
+    """
+    Keep the identity columns and the ones for the requested stats, in the stats type asked for. \n
+    Falls back to every column of that stats type when none of the stats match a column. \n
+    Returns the columns and their comma-joined listing, memoized since the same dataset columns come back on every query.
+    """
+    suffix = STATS_TYPE_SUFFIXES.get(stats_type)
+    other_suffixes = tuple(s for s in STATS_TYPE_SUFFIXES.values() if s != suffix) if suffix else ()
+    candidates = [col for col in columns if not col.endswith(other_suffixes)] if other_suffixes else list(columns)
+
+    codes = {stat_code(stat) for stat in stats}
+    # A shot stat brings its attempts and percentage along ("field goals" -> FGM, FGA, FG_PCT)
+    families = {SHOT_STAT_FAMILIES[code] for code in codes if code in SHOT_STAT_FAMILIES}
+    identity = [col for col in candidates if col in IDENTITY_COLUMNS]
+    matched = []
+    for col in candidates:
+        base = col[:-len(suffix)] if suffix and col.endswith(suffix) else col
+        if col in IDENTITY_COLUMNS:
+            continue
+        if any(base == code or base.startswith(f"{code}_") for code in codes) or \
+                any(base == f"{family}A" or base.startswith(f"{family}_") for family in families):
+            matched.append(col)
+
+    selected = tuple(col for col in candidates if col in identity or col in matched) if matched else tuple(candidates)
+    return selected, ", ".join(selected)
+
+def question_cache_key(prefix: str, question: str) -> str:
+    """
+    Build the cache key for something derived from a question, normalized and scoped to the configured LLM provider. \n
+    The current season is part of the key since analyses default to it and answers about "this season" change when it rolls over.
+    """
+    payload = orjson.dumps({
+        "q": " ".join(question.lower().split()),
+        "provider": get_provider(),
+        "season": NBASettings.get_current_season(),
+    }, option=orjson.OPT_SORT_KEYS)
+    return f"{prefix}:{hashlib.sha256(payload).hexdigest()}"
+
+# Option lists for the prompt, derived from the schema once so the two can't drift apart
+INTENT_VALUES = ", ".join(e.value for e in QueryIntent)
+TIMEFRAME_VALUES = ", ".join(e.value for e in Timeframe)
+COMPARISON_TYPE_VALUES = ", ".join(e.value for e in ComparisonType)
+
+@lru_cache(maxsize=8)
+def analysis_system_message(current_season: str, provider: str) -> SystemMessage:
+    """
+    Analysis instructions for the given current season, built once per season and LLM provider. \n
+    Keyed on the season so a long running process moves the prompt on with the calendar, and on the provider
+    since the message shape depends on it. Kept free of per-request values so it stays a stable, cacheable prompt prefix.
+    """
+    seasons_values = ", ".join(NBASettings.get_season_list(num_seasons=NBASettings.DEFAULT_NUM_SEASONS, current_season=current_season))
+    return cacheable_system_message(provider=provider, content=f"""
+    You are an NBA data analyst. Analyze the user's question and extract the following information in JSON format:
+
+    {{
+        "intent": "one of: {INTENT_VALUES}",
+        "players": ["list of player names mentioned"],
+        "teams": ["list of team names mentioned"], 
+        "seasons": ["list of seasons mentioned, convert to format like '2023-24'"],
+        "stats": ["list of statistical categories mentioned like 'points', 'assists', 'rebounds'"],
+        "stats_type": "one of: per_game, totals, advanced". If not specified default to per_game",
+        "timeframe": "one of: {TIMEFRAME_VALUES}",
+        "comparison_type": "if comparing, what type: {COMPARISON_TYPE_VALUES}",
+        "top_n": "if asking for top performers, how many (default 10)"
+    }}
+
+    Available seasons: {seasons_values}
+    If no season is specified, assume current season ({current_season}).
+    Be flexible with player names (LeBron = LeBron James, Curry = Stephen Curry, etc.).
+    Be flexible with team names (Lakers = Los Angeles Lakers, Warriors = Golden State Warriors, etc.).
+""")
+
+# Static instructions for answering, the per-query details follow in a separate message
+ANSWER_INSTRUCTIONS = """
+    You are an expert NBA analyst. Use the provided data to answer the user's question.
+    The user's message describes the question (intent, players, teams, seasons, stats) and the data columns available.
+
+    If the stats type is totals use columns ending with '_TOTALS', if per_game use '_PER_GAME'.
+
+    Provide a concise, informative answer based on the data.
+"""
+
+@lru_cache(maxsize=8)
+def answer_system_message(provider: str) -> SystemMessage:
+    """ Answer instructions as a system message, built once per LLM provider since the message shape depends on it """
+    return cacheable_system_message(ANSWER_INSTRUCTIONS, provider=provider)
+
 class QueryProcessor:
     """
     Processes natural language queries about NBA data using LangChain
     """
 
-    def __init__(self, storage: BaseStorage):
+    # Upper bound on concurrent provider requests when answering a batch of questions
+    BATCH_MAX_CONCURRENCY = 8
+
+    # Returned whenever there is no data, never mutated, so one instance is shared instead of building a frame each time
+    EMPTY_DATA = pd.DataFrame()
+
+    def __init__(self, storage: BaseStorage, nba_client: Optional[NBAApiClient] = None):
+        """ Pass `nba_client` to share its loaded dataset and alias indexes with other users of the same storage """
         self.llm = get_llm()
-        self.nba_client = NBAApiClient(storage=storage)
+        # Built once, so the QueryAnalysis schema is not converted to a tool spec on every question
+        self.structured_llm = self.llm.with_structured_output(QueryAnalysis, include_raw=True)
+        self.nba_client = nba_client or NBAApiClient(storage=storage)
 
     def query(self, query: str):
-        analysis = self._analyze_query(query)
+        analysis = self._while_loading_data(self._analyze_query, query)
         
         data = self._fetch_relevant_data(analysis)
         
@@ -63,144 +194,328 @@ class QueryProcessor:
 
         return answer
 
-    def _analyze_query(self, question: str) -> Dict[str, Any]:
+    async def aquery(self, query: str):
+        """ Async version of `query`, pandas work runs in a worker thread to keep the event loop free """
+        analysis, _ = await asyncio.gather(self._aanalyze_query(query), self._aload_data())
+
+        data = await asyncio.to_thread(self._fetch_relevant_data, analysis)
+
+        answer = await self._agenerate_answer(analysis=analysis, data=data)
+
+        return answer
+
+    def batch_query(self, queries: List[str]) -> List[Union[str, Exception]]:
         """
-        Analyze the user's question to extract intent and parameters
+        Answer several questions with one LLM batch call per stage (analysis, then answer). \n
+        Returns one answer per question, or the exception if its analysis failed.
         """
+        config = {"max_concurrency": self.BATCH_MAX_CONCURRENCY}
 
-        structured_llm = self.llm.with_structured_output(QueryAnalysis)
-
-        system_prompt = f"""
-            You are an NBA data analyst. Analyze the user's question and extract the following information in JSON format:
-
-            {{
-                "intent": "one of: player_stats, player_comparison, team_stats, team_comparison, top_performers, season_analysis",
-                "players": ["list of player names mentioned"],
-                "teams": ["list of team names mentioned"], 
-                "seasons": ["list of seasons mentioned, convert to format like '2023-24'"],
-                "stats": ["list of statistical categories mentioned like 'points', 'assists', 'rebounds'"],
-                "stats_type": "one of: per_game, totals, advanced". If not specified default to per_game",
-                "timeframe": "one of: season, career, game, recent",
-                "comparison_type": "if comparing, what type: vs, ranking, top_n",
-                "top_n": "if asking for top performers, how many (default 10)"
-            }}
-
-            Available seasons: {', '.join(nba_settings.DEFAULT_SEASONS_LIST)}
-            If no season is specified, assume current season ({nba_settings.DEFAULT_SEASON}).
-            Be flexible with player names (LeBron = LeBron James, Curry = Stephen Curry, etc.).
-            Be flexible with team names (Lakers = Los Angeles Lakers, Warriors = Golden State Warriors, etc.).
-        """
+        keys, analyses, missing = self._cached_analyses(queries)
+        if missing:
+            results = self._while_loading_data(
+                self.structured_llm.batch, [self._analysis_messages(queries[i]) for i in missing], config=config, return_exceptions=True
+            )
+            self._fill_analyses(keys, analyses, missing, results)
+
+        datas = self._fetch_batch_data(analyses)
+
+        indexes, inputs = self._batch_answer_inputs(analyses, datas)
+        responses = self.llm.batch(inputs, config=config, return_exceptions=True) if inputs else []
+
+        return self._batch_answers(analyses, indexes, responses)
+
+    async def abatch_query(self, queries: List[str]) -> List[Union[str, Exception]]:
+        """ Async version of `batch_query` """
+        config = {"max_concurrency": self.BATCH_MAX_CONCURRENCY}
+
+        keys, analyses, missing = await asyncio.to_thread(self._cached_analyses, queries)
+        if missing:
+            results, _ = await asyncio.gather(
+                self.structured_llm.abatch([self._analysis_messages(queries[i]) for i in missing], config=config, return_exceptions=True),
+                self._aload_data(),
+            )
+            await asyncio.to_thread(self._fill_analyses, keys, analyses, missing, results)
+        else:
+            await self._aload_data()
+
+        datas = await asyncio.to_thread(self._fetch_batch_data, analyses)
+
+        indexes, inputs = self._batch_answer_inputs(analyses, datas)
+        responses = await self.llm.abatch(inputs, config=config, return_exceptions=True) if inputs else []
+
+        return self._batch_answers(analyses, indexes, responses)
+
+    def _cached_analyses(self, queries: List[str]) -> Tuple[List[str], List[Optional[QueryAnalysis]], List[int]]:
+        """ Look up the batch's analyses in the cache, returning their keys, the cached analyses and the positions still missing """
+        keys = [question_cache_key("analysis", q) for q in queries]
+        analyses = [cache.get(key) for key in keys]
+        missing = [i for i, analysis in enumerate(analyses) if analysis is None]
+        return keys, analyses, missing
+
+    def _fill_analyses(self, keys: List[str], analyses: List[Any], missing: List[int], results: List[Any]):
+        """ Put the batch results for the missing positions in place, caching the ones that parsed """
+        for i, result in zip(missing, results):
+            analyses[i] = result if isinstance(result, Exception) else self._remember_analysis(keys[i], self._parse_analysis(result))
 
-        messages = [
-            SystemMessage(content=system_prompt),
+    def _fetch_batch_data(self, analyses: List[Union[QueryAnalysis, Exception]]) -> List[pd.DataFrame]:
+        """ Fetch data once per distinct set of fetch parameters in the batch """
+        fetched: Dict[Tuple, pd.DataFrame] = {}
+        datas = []
+        for analysis in analyses:
+            if isinstance(analysis, Exception):
+                datas.append(self.EMPTY_DATA)
+                continue
+
+            key = (
+                str(analysis.intent), tuple(analysis.players), tuple(analysis.teams), tuple(analysis.seasons),
+                tuple(analysis.stats), analysis.stats_type, analysis.top_n,
+            )
+            if key not in fetched:
+                fetched[key] = self._fetch_relevant_data(analysis)
+            datas.append(fetched[key])
+        return datas
+
+    def _batch_answer_inputs(self, analyses: List[Union[QueryAnalysis, Exception]], datas: List[pd.DataFrame]) -> Tuple[List[int], List[List[BaseMessage]]]:
+        """ Answer prompts for the questions that have data, with their positions in the batch """
+        indexes, inputs = [], []
+        for i, (analysis, data) in enumerate(zip(analyses, datas)):
+            if isinstance(analysis, Exception) or data.empty:
+                continue
+            indexes.append(i)
+            inputs.append(self._answer_messages(analysis, data))
+        return indexes, inputs
+
+    def _batch_answers(self, analyses: List[Union[QueryAnalysis, Exception]], indexes: List[int], responses: List[Any]) -> List[Union[str, Exception]]:
+        answers = [a if isinstance(a, Exception) else NO_DATA_ANSWER for a in analyses]
+        for i, response in zip(indexes, responses):
+            if isinstance(response, Exception):
+                logger.error("Error generating answer: %s", response)
+                answers[i] = ERROR_ANSWER
+            else:
+                answers[i] = response.content
+        return answers
+
+    def stream_query(self, query: str) -> Iterator[str]:
+        """ Stream the answer as it is generated. Errors are raised to the caller, which owns the response """
+        analysis = self._while_loading_data(self._analyze_query, query)
+
+        data = self._fetch_relevant_data(analysis)
+
+        yield from self._stream_answer(analysis=analysis, data=data)
+
+    async def astream_query(self, query: str) -> AsyncIterator[str]:
+        """ Async version of `stream_query` """
+        analysis, _ = await asyncio.gather(self._aanalyze_query(query), self._aload_data())
+
+        data = await asyncio.to_thread(self._fetch_relevant_data, analysis)
+
+        async for chunk in self._astream_answer(analysis=analysis, data=data):
+            yield chunk
+
+    def _while_loading_data(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """ Sync counterpart of gathering with `_aload_data`, calls `func` while the dataset loads in a worker thread """
+        if self.nba_client.cached_data:
+            return func(*args, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            loading = pool.submit(self.nba_client.load_data, entities=list(STATS_DATASETS))
+            result = func(*args, **kwargs)
+            loading.result()
+        return result
+
+    async def _aload_data(self):
+        """ Load the stats datasets in a worker thread, so the storage read overlaps the analysis LLM call instead of following it """
+        if not self.nba_client.cached_data:
+            await asyncio.to_thread(self.nba_client.load_data, entities=list(STATS_DATASETS))
+
+    def _analysis_messages(self, question: str) -> List[BaseMessage]:
+        """ Build the prompt used to extract intent and parameters from the user's question """
+        return [
+            analysis_system_message(NBASettings.get_current_season(), get_provider()),
             HumanMessage(content=f"Analyze this NBA question: {question}")
         ]
 
+    def _parse_analysis(self, result: Dict[str, Any]) -> QueryAnalysis:
+        """ Pick the analysis out of the structured output (requested with include_raw), falling back on parse errors """
+        analysis = result.get("parsed")
+        if result.get("parsing_error") is not None or analysis is None:
+            analysis = self._analysis_from_raw(result.get("raw"))
+            if analysis is None:
+                logger.error("Failed to parse LLM output, returning default analysis: %s", result.get("parsing_error"))
+                logger.debug("Raw LLM output: %s", result.get("raw"))
+                return self._default_analysis()
+
+        # Only serialize the analysis when it is actually going to be logged
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Query analysis successful: %s", analysis.model_dump(exclude_defaults=True))
+        return analysis
+
+    def _analysis_from_raw(self, raw: Any) -> Optional[QueryAnalysis]:
+        """ Some providers answer with the JSON as plain text instead of a tool call, parse it in a single pass """
+        content = getattr(raw, "content", None)
+        if not isinstance(content, str) or not content.strip().startswith("{"):
+            return None
         try:
-            analysis = structured_llm.invoke(messages)
-
-            result = analysis.model_dump()
-
-            if not result.get("seasons"):
-                result["seasons"] = [nba_settings.DEFAULT_SEASON]
-
-            logger.info(f"Query analysis successful: {result}")
-            return result
-        except json.JSONDecodeError:
-            logger.error("Failed to parse LLM output, returning default analysis")
-            return {
-                "intent": "general",
-                "players": [],
-                "teams": [],
-                "seasons": [nba_settings.DEFAULT_SEASON],
-                "stats": [],
-                "timeframe": "season"
-            }
+            return QueryAnalysis.model_validate_json(content)
+        except ValidationError:
+            return None
+
+    def _default_analysis(self) -> QueryAnalysis:
+        # "general" is not a QueryIntent, so skip validation rather than widen the schema sent to the LLM
+        return QueryAnalysis.model_construct(
+            intent="general",
+            seasons=[nba_settings.DEFAULT_SEASON],
+        )
+
+    def _remember_analysis(self, key: str, analysis: QueryAnalysis) -> QueryAnalysis:
+        """ Cache a parsed analysis, the default one stands for a failed parse and is left out """
+        if isinstance(analysis.intent, QueryIntent):
+            cache.set(key, analysis, ttl=ANALYSIS_CACHE_TTL)
+        return analysis
+
+    async def _aremember_analysis(self, key: str, analysis: QueryAnalysis) -> QueryAnalysis:
+        """ Async version of `_remember_analysis` """
+        if isinstance(analysis.intent, QueryIntent):
+            await cache.aset(key, analysis, ttl=ANALYSIS_CACHE_TTL)
+        return analysis
+
+    def _analyze_query(self, question: str) -> QueryAnalysis:
+        """
+        Analyze the user's question to extract intent and parameters
+        """
+        key = question_cache_key("analysis", question)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+        result = self.structured_llm.invoke(self._analysis_messages(question))
+        return self._remember_analysis(key, self._parse_analysis(result))
+
+    async def _aanalyze_query(self, question: str) -> QueryAnalysis:
+        """ Async version of `_analyze_query` """
+        key = question_cache_key("analysis", question)
+        cached = await cache.aget(key)
+        if cached is not None:
+            return cached
+
+        result = await self.structured_llm.ainvoke(self._analysis_messages(question))
+        return await self._aremember_analysis(key, self._parse_analysis(result))
         
-    def _fetch_relevant_data(self, analysis: Dict[str, Any]) -> pd.DataFrame:
+    def _fetch_relevant_data(self, analysis: QueryAnalysis) -> pd.DataFrame:
         """
         Fetch relevant NBA data based on the analysis
         """
         
-        intent = analysis.get("intent", "player_stats") # Use player_stats as a fallback
-        players =  analysis.get("players", [])
-        teams = analysis.get("teams", [])
-        seasons = analysis.get("seasons", [nba_settings.DEFAULT_SEASON])
-        top_n = analysis.get("top_n", 10)
+        intent = analysis.intent
+        players = analysis.players
+        teams = analysis.teams
+        seasons = analysis.seasons
+        top_n = analysis.top_n
 
         try:
             if intent in [QueryIntent.PLAYER_COMPARISON, QueryIntent.PLAYER_STATS]:
-                logger.info(f"Fetching player stats for players: {players} in seasons: {seasons}")
+                logger.info("Fetching player stats for players: %s in seasons: %s", players, seasons)
                 data = self.nba_client.get_player_stats(players=players, seasons=seasons)
             elif intent in [QueryIntent.TEAM_COMPARISON, QueryIntent.TEAM_STATS]:
-                logger.info(f"Fetching team stats for teams: {teams} in seasons: {seasons}")
+                logger.info("Fetching team stats for teams: %s in seasons: %s", teams, seasons)
                 data = self.nba_client.get_team_stats(teams=teams, seasons=seasons)
-            # elif intent == QueryIntent.TOP_PERFORMERS:
-            #     logger.info(f"Fetching top {top_n} performers in seasons: {seasons}")
-            #     data = self.nba_client.get_top_performers(seasons=seasons, top_n=top_n)
+            elif intent == QueryIntent.TOP_PERFORMERS:
+                stat = analysis.stats[0] if analysis.stats else DEFAULT_TOP_STAT
+                logger.info("Fetching top %d performers by %s in seasons: %s", top_n, stat, seasons)
+                data = self.nba_client.get_top_players(seasons=seasons, stat=stat, stats_type=analysis.stats_type or "per_game", top_n=top_n)
             # else:
             #     logger.info(f"Fetching general player stats for seasons: {seasons[0]}")
             #     season = seasons[0] if seasons else nba_settings.DEFAULT_SEASON
             #     data = self.nba_client.get_player_stats(seasons=[season])
             else:
-                logger.info(f"Intent '{intent}' not recognized. Returning empty DataFrame.")
-                data = pd.DataFrame()
+                logger.info("Intent '%s' not recognized. Returning empty DataFrame.", intent)
+                data = self.EMPTY_DATA
 
-            logger.info(f"Fetched {len(data)} records")
+            logger.info("Fetched %d records", len(data))
             return data
         except Exception as e:
-            logger.error(f"Error fetching NBA data: {e}")
-            return pd.DataFrame()
+            logger.error("Error fetching NBA data: %s", e)
+            return self.EMPTY_DATA
         
-    def _generate_answer(self, analysis: Dict[str, Any], data: pd.DataFrame, stream: bool = False) -> Generator[Any, Any, Any]:
+    def _answer_messages(self, analysis: QueryAnalysis, data: pd.DataFrame) -> List[BaseMessage]:
+        """ Build the prompt used to answer the user's question from the fetched data """
+        intent = analysis.intent
+        players = analysis.players
+        teams = analysis.teams
+        seasons = analysis.seasons
+        stats = analysis.stats
+        stats_type = analysis.stats_type or "per_game"
+        top_n = analysis.top_n
+        timeframe = analysis.timeframe
+        columns, columns_text = select_answer_columns(tuple(data.columns), tuple(stats), stats_type)
+
+        context = f"""
+            User's question intent: {intent}
+            Players mentioned: {', '.join(players) if players else 'None'}
+            Teams mentioned: {', '.join(teams) if teams else 'None'}
+            Timeframe: {timeframe}
+            Seasons: {', '.join(seasons)}
+            Stats of interest: {', '.join(stats) if stats else 'All available stats'}
+            Stats type: {stats_type}
+            Top N (if applicable): {top_n}
+            Data columns available: {columns_text}
+        """
+        # Limit to the first records of the relevant columns (top N asks for exactly N per season), serialized compactly by pandas' C encoder
+        sample_rows = top_n * len(seasons) if intent == QueryIntent.TOP_PERFORMERS else ANSWER_SAMPLE_ROWS
+        data_sample = data.iloc[:sample_rows][list(columns)].to_json(orient="records", double_precision=ANSWER_FLOAT_PRECISION)
+
+        return [
+            answer_system_message(get_provider()),
+            HumanMessage(content=context),
+            HumanMessage(content=f"Here is some NBA data:\n{data_sample}"),
+            HumanMessage(content="Based on this data, please answer the user's question.")
+        ]
+
+    def _generate_answer(self, analysis: QueryAnalysis, data: pd.DataFrame) -> str:
         """ Generate a natural language answer based on the analysis and data """
         try:
             if data.empty:
-                return "No relevant NBA data found to answer your question."
-
-            intent = analysis.get("intent", "player_stats")
-            players =  analysis.get("players", [])
-            teams = analysis.get("teams", [])
-            seasons = analysis.get("seasons", [nba_settings.DEFAULT_SEASON])
-            stats = analysis.get("stats", [])
-            stats_type = analysis.get("stats_type", "per_game")
-            top_n = analysis.get("top_n", 10)
-            timeframe = analysis.get("timeframe", "season")
-
-            system_prompt = f"""
-                You are an expert NBA analyst. Use the provided data to answer the user's question.
-
-                User's question intent: {intent}
-                Players mentioned: {', '.join(players) if players else 'None'}
-                Teams mentioned: {', '.join(teams) if teams else 'None'}
-                Timeframe: {timeframe}
-                Seasons: {', '.join(seasons)}
-                Stats of interest: {', '.join(stats) if stats else 'All available stats'}
-                Stats type: {stats_type}
-                Top N (if applicable): {top_n}
-                
-                If the stats type is totals use columns ending with '_TOTALS', if per_game use '_PER_GAME'.
-                Data columns available: {', '.join(data.columns.tolist())}
-
-                Provide a concise, informative answer based on the data.
-            """
-            data_sample = data.head(10).to_dict(orient="records")  # Limit to first 10 records for context
-
-            messages = [
-                SystemMessage(content=system_prompt),
-                HumanMessage(content=f"Here is some NBA data:\n{json.dumps(data_sample, indent=2)}"),
-                HumanMessage(content="Based on this data, please answer the user's question.")
-            ]
-
-            response = self.llm.invoke(messages)
+                return NO_DATA_ANSWER
+
+            response = self.llm.invoke(self._answer_messages(analysis, data))
             answer = response.content
 
             return answer
         except Exception as e:
-            logger.error(f"Error generating answer: {e}")
-            return "Sorry, I encountered an error while generating the answer."
-        
-        
+            logger.error("Error generating answer: %s", e)
+            return ERROR_ANSWER
 
-    
-        
\ No newline at end of file
+    def _stream_answer(self, analysis: QueryAnalysis, data: pd.DataFrame) -> Iterator[str]:
+        """ Yield the answer chunk by chunk, so the first tokens reach the caller while the rest is generated """
+        if data.empty:
+            yield NO_DATA_ANSWER
+            return
+
+        for chunk in self.llm.stream(self._answer_messages(analysis, data)):
+            if chunk.content:
+                yield chunk.content
+
+    async def _astream_answer(self, analysis: QueryAnalysis, data: pd.DataFrame) -> AsyncIterator[str]:
+        """ Async version of `_stream_answer` """
+        if data.empty:
+            yield NO_DATA_ANSWER
+            return
+
+        async for chunk in self.llm.astream(self._answer_messages(analysis, data)):
+            if chunk.content:
+                yield chunk.content
+
+    async def _agenerate_answer(self, analysis: QueryAnalysis, data: pd.DataFrame) -> str:
+        """ Async version of `_generate_answer` """
+        try:
+            if data.empty:
+                return NO_DATA_ANSWER
+
+            response = await self.llm.ainvoke(self._answer_messages(analysis, data))
+            answer = response.content
+
+            return answer
+        except Exception as e:
+            logger.error("Error generating answer: %s", e)
+            return ERROR_ANSWER
@@ -4,12 +4,150 @@ from ..storage.base_storage import BaseStorage
 from ...core.settings import nba_settings
 from ...core.cache import cache
 
+import math
+import time
+import numpy as np
 import pandas as pd
-from typing import Dict, List
+from collections import Counter
+from functools import lru_cache
+from itertools import product
+from typing import Any, Callable, Collection, Dict, Iterable, List, Optional, Tuple, TypeVar
+from uuid import uuid4
 import logging
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+# Stat names as the analysis extracts them, mapped to the nba_api column they come from
+STAT_COLUMN_ALIASES = {
+    "points": "PTS",
+    "assists": "AST",
+    "rebounds": "REB",
+    "offensive rebounds": "OREB",
+    "defensive rebounds": "DREB",
+    "steals": "STL",
+    "blocks": "BLK",
+    "turnovers": "TOV",
+    "fouls": "PF",
+    "minutes": "MIN",
+    "games": "GP",
+    "games played": "GP",
+    "wins": "W",
+    "losses": "L",
+    "field goals": "FGM",
+    "three pointers": "FG3M",
+    "3 pointers": "FG3M",
+    "free throws": "FTM",
+    "plus minus": "PLUS_MINUS",
+}
+
+# Made-shot codes and the family their attempts and percentage columns share (FGM -> FGA, FG_PCT)
+SHOT_STAT_FAMILIES = {"FGM": "FG", "FG3M": "FG3", "FTM": "FT"}
+
+STATS_TYPE_SUFFIXES = {"per_game": "_PER_GAME", "totals": "_TOTALS"}
+
+# Stored dataset names holding the per-season stats, the ones queries read
+PLAYER_STATS_DATASET = "player"
+TEAM_STATS_DATASET = "team"
+STATS_DATASETS = (PLAYER_STATS_DATASET, TEAM_STATS_DATASET)
+
+# Repeated name columns stored as categoricals, each distinct name is held once and rows keep a small code
+NAME_COLUMNS = ("PLAYER_NAME", "TEAM_NAME", "TEAM_ABBREVIATION")
+
+@lru_cache(maxsize=256)
+def stat_code(stat: str) -> str:
+    """ nba_api column code for a stat name ("points" -> "PTS"), unknown names are assumed to already be a code """
+    return STAT_COLUMN_ALIASES.get(stat.lower().strip(), stat.upper().strip().replace(" ", "_"))
+
+@lru_cache(maxsize=256)
+def stat_column_candidates(stat: str, stats_type: str) -> Tuple[str, str]:
+    """ Column names a stat can live under, the requested stats type first and the unsuffixed code second """
+    code = stat_code(stat)
+    return f"{code}{STATS_TYPE_SUFFIXES.get(stats_type, '')}", code
+
+def resolve_stat_column(stat: str, stats_type: str, columns: Collection[str]) -> Optional[str]:
+    """ Column holding a stat ("points" -> "PTS_PER_GAME"), preferring the requested stats type over the unsuffixed column """
+    # A DataFrame's columns Index already has hashed lookups, no need to copy it into a set
+    for candidate in stat_column_candidates(stat, stats_type):
+        if candidate in columns:
+            return candidate
+    return None
+
+def descending_order(values: np.ndarray) -> np.ndarray:
+    """ Positions of `values` from largest to smallest, ties in position order and NaNs left out """
+    order = np.argsort(-values, kind="stable")
+    return order[~np.isnan(values[order])]
+
+def first_n_per_group(codes: np.ndarray, top_n: int) -> np.ndarray:
+    """ Positions of the first `top_n` entries of every group in `codes`, groups in code order """
+    if not len(codes):
+        return np.array([], dtype=np.intp)
+    return np.concatenate([np.flatnonzero(codes == code)[:top_n] for code in np.unique(codes)])
+
+def categorize_names(dataset: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """ Copy of a dataset with the name columns of every frame cast to categoricals """
+    categorized = {}
+    for name, df in dataset.items():
+        columns = [column for column in NAME_COLUMNS if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype)]
+        categorized[name] = df.astype(dict.fromkeys(columns, "category")) if columns else df
+    return categorized
+
+def downcast_numerics(dataset: Dict[str, pd.DataFrame]) -> Dict[str, pd.DataFrame]:
+    """ Copy of a dataset with float64 columns stored as float32, and int64 columns as int32 where the values fit """
+    int32 = np.iinfo(np.int32)
+    downcast = {}
+    for name, df in dataset.items():
+        dtypes = {}
+        for column, dtype in df.dtypes.items():
+            if dtype == np.float64:
+                dtypes[column] = np.float32
+            elif dtype == np.int64 and (df.empty or (df[column].min() >= int32.min and df[column].max() <= int32.max)):
+                dtypes[column] = np.int32
+        downcast[name] = df.astype(dtypes) if dtypes else df
+    return downcast
+
+def prepare_dataset(dataset: Dict[str, pd.DataFrame], downcast: bool = True) -> Dict[str, pd.DataFrame]:
+    """ Dataset as read from storage, converted to the in-memory layout queries run against """
+    dataset = categorize_names(dataset)
+    return downcast_numerics(dataset) if downcast else dataset
+
+# Seconds a process serves its local copy of the datasets before checking the shared version again
+DATASET_VERSION_CHECK_INTERVAL = 5.0
+
+def dataset_version_key(prefix: str) -> str:
+    """ Shared cache key changed by every ingest of `prefix`, so other processes can tell their local datasets are stale """
+    return f"dataset:{prefix}:version"
+
+def dataset_cache_keys(prefix: str, dataset_names: Iterable[str]) -> List[str]:
+    """ Every cache key a stored dataset can be loaded under: whole and per dataset, for both load modes and precisions """
+    # Stored files are read back under the first word of their name ("player_stats" -> "player")
+    names = dict.fromkeys(name.split("_")[0] for name in dataset_names)
+    keys = []
+    for mode in ("latest", "all"):
+        for precision in ("", ":float64"):
+            base_key = f"dataset:{prefix}:{mode}{precision}"
+            keys.append(base_key)
+            keys.extend(f"{base_key}:{name}" for name in names)
+    return keys
+
+def build_alias_index(names: Iterable[str]) -> Dict[str, str]:
+    """
+    Map lower-cased full names, and any single word that only appears in one name
+    (e.g. "curry" or "lakers"), to the canonical full name.
+    """
+    full_names = {name.lower(): name for name in names if isinstance(name, str)}
+    word_counts = Counter(word for lowered in full_names for word in set(lowered.split()))
+
+    index = {}
+    for lowered, name in full_names.items():
+        for word in lowered.split():
+            if word_counts[word] == 1:
+                index[word] = name
+    # Full names win over a clashing single-word alias
+    index.update(full_names)
+    return index
+
 class NBAApiClient:
     """
     High-level client that orchestrates data collection and storage
@@ -18,11 +156,151 @@ class NBAApiClient:
     def __init__(self, storage: BaseStorage):
         self.cached_data: Dict[str, pd.DataFrame] = {}
         self.storage = storage
+        self._collector: Optional[NBADataCollector] = None
+        # Process-local tier in front of the shared cache, so file/Redis entries are deserialized once per process.
+        # Dropped when the shared dataset version changes, whichever process ran the ingest
+        self._mem_cache: Dict[str, Any] = {}
+        # Shared dataset version the local data of each prefix belongs to, and when it was last checked
+        self._data_versions: Dict[str, Any] = {}
+        self._versions_checked_at: Dict[str, float] = {}
+        # Lookups derived from a loaded dataset, each kept with the frame it was built from
+        self._alias_indexes: Dict[str, Tuple[pd.DataFrame, Dict[str, str]]] = {}
+        self._lowered_names: Dict[str, Tuple[pd.DataFrame, pd.Series]] = {}
+        self._row_indexes: Dict[str, Tuple[pd.DataFrame, Dict[Tuple[str, str], np.ndarray]]] = {}
+        self._stat_orders: Dict[Tuple[str, str], Tuple[pd.DataFrame, np.ndarray]] = {}
+
+    def _derived(self, lookups: Dict[Any, Tuple[pd.DataFrame, T]], key: Any, df: pd.DataFrame, build: Callable[[], T]) -> T:
+        """
+        Lookup derived from `df`, built once and kept with the frame it came from. \n
+        A caller still holding a frame from before a reload gets a lookup for that frame, never one built from the new data.
+        """
+        entry = lookups.get(key)
+        if entry is None or entry[0] is not df:
+            entry = (df, build())
+            lookups[key] = entry
+        return entry[1]
+
+    def _frame(self, dataset_name: str, df: Optional[pd.DataFrame]) -> pd.DataFrame:
+        return df if df is not None else self.cached_data.get(dataset_name, pd.DataFrame())
+
+    def resolve_names(self, names: List[str], dataset_name: str, name_col: str, df: Optional[pd.DataFrame] = None) -> List[str]:
+        """ Resolve free-text names ("LeBron", "Warriors") to the canonical names in a dataset (the loaded one unless `df` is given), built once per dataset """
+        df = self._frame(dataset_name, df)
+        index = self._derived(self._alias_indexes, dataset_name, df, lambda: build_alias_index(df[name_col].unique()) if name_col in df.columns else {})
+
+        return [index.get(name.lower().strip(), name) for name in names]
+
+    def lowered_names(self, dataset_name: str, name_col: str, df: Optional[pd.DataFrame] = None) -> pd.Series:
+        """ Lower-cased name column of a dataset as a categorical, built once per dataset so filters don't re-lower every row """
+        df = self._frame(dataset_name, df)
+
+        def build() -> pd.Series:
+            names = df[name_col]
+            if not isinstance(names.dtype, pd.CategoricalDtype):
+                names = names.astype("category")
+            # Lower the distinct names only, rows keep their category codes
+            return names.map(str.lower).astype("category")
+
+        return self._derived(self._lowered_names, dataset_name, df, build)
+
+    def row_index(self, dataset_name: str, name_col: str, season_col: str = "season", df: Optional[pd.DataFrame] = None) -> Dict[Tuple[str, str], np.ndarray]:
+        """ Row positions of a dataset keyed by (lower-cased name, season), built once per dataset """
+        df = self._frame(dataset_name, df)
+        return self._derived(
+            self._row_indexes, dataset_name, df,
+            lambda: df.groupby([self.lowered_names(dataset_name, name_col, df), df[season_col]], observed=True, sort=False).indices,
+        )
+
+    def stat_order(self, dataset_name: str, column: str, df: Optional[pd.DataFrame] = None) -> np.ndarray:
+        """ Row positions of a dataset from the highest to the lowest value of a stat column, built once per dataset and column """
+        df = self._frame(dataset_name, df)
+        return self._derived(
+            self._stat_orders, (dataset_name, column), df,
+            lambda: descending_order(df[column].to_numpy(dtype=np.float64, na_value=np.nan)),
+        )
+
+    def _select_rows(self, dataset_name: str, df: pd.DataFrame, names: List[str], seasons: List[str], name_col: str, season_col: str) -> pd.DataFrame:
+        """ Rows for the given names and seasons, looked up by key instead of scanning the name and season columns """
+        index = self.row_index(dataset_name, name_col, season_col, df)
+        # Duplicate names ("LeBron James", "lebron james") and seasons collapse before any lookup
+        wanted_names = frozenset(map(str.lower, names))
+        wanted_seasons = frozenset(seasons)
+        positions = [index[key] for key in product(wanted_names, wanted_seasons) if key in index]
+        if not positions:
+            return df.iloc[[]]
+        # Sorted so rows come back in dataset order, as a boolean filter would return them
+        return df.iloc[np.sort(np.concatenate(positions))]
+
+    def _reset_indexes(self, dataset_names: Optional[Iterable[str]] = None):
+        """ Drop the name lookups and stat orders of the given datasets (all when None), they are rebuilt lazily for the newly loaded data """
+        if dataset_names is None:
+            self._alias_indexes = {}
+            self._lowered_names = {}
+            self._row_indexes = {}
+            self._stat_orders = {}
+            return
+        dataset_names = set(dataset_names)
+        for dataset_name in dataset_names:
+            self._alias_indexes.pop(dataset_name, None)
+            self._lowered_names.pop(dataset_name, None)
+            self._row_indexes.pop(dataset_name, None)
+        self._stat_orders = {key: order for key, order in self._stat_orders.items() if key[0] not in dataset_names}
+
+    def _cache_get(self, key: str) -> Any:
+        """ Cached value from the process-local tier, falling back to the shared cache """
+        value = self._mem_cache.get(key)
+        if value is None:
+            value = cache.get(key)
+            if value is not None:
+                self._mem_cache[key] = value
+        return value
+
+    def _cache_set(self, key: str, value: Any):
+        self._mem_cache[key] = value
+        cache.set(key, value)
+
+    def clear_cached_data(self, prefix: str, dataset_names: Iterable[str]):
+        """ Forget the loaded datasets of a prefix, in this process and in the shared cache, so the next query reads storage again \n
+            A new shared version tells the other processes to drop their local copies too
+        """
+        for key in dataset_cache_keys(prefix, dataset_names):
+            cache.delete(key)
+        version = uuid4().hex
+        cache.set(dataset_version_key(prefix), version)
+        self._data_versions[prefix] = version
+        self._drop_local_data()
+
+    def _drop_local_data(self):
+        self._mem_cache = {}
+        self.cached_data = {}
+        self._reset_indexes()
+
+    def _sync_data_version(self, prefix: str):
+        """ Drop the local datasets once another process ingested new data for `prefix`, checked at most every DATASET_VERSION_CHECK_INTERVAL """
+        now = time.monotonic()
+        if now - self._versions_checked_at.get(prefix, -math.inf) < DATASET_VERSION_CHECK_INTERVAL:
+            return
+        self._versions_checked_at[prefix] = now
+
+        version = cache.get(dataset_version_key(prefix))
+        if prefix in self._data_versions and self._data_versions[prefix] != version:
+            logger.info("Datasets for %s were refreshed by another process, dropping the local copy", prefix)
+            self._drop_local_data()
+        self._data_versions[prefix] = version
+
+    def get_dataset(self, dataset_name: str, prefix: str = "nba-data") -> pd.DataFrame:
+        """ A single dataset ("player", "team", ...), loading only that one from storage if it is not loaded yet """
+        self._sync_data_version(prefix)
+        if dataset_name not in self.cached_data:
+            self.load_data(prefix=prefix, entities=[dataset_name])
+        return self.cached_data.get(dataset_name, pd.DataFrame())
 
     def collect_and_store_dataset(self, seasons: List[str] = None, prefix: str = "nba-data") -> bool:
         """ Collect data for specified seasons and store to specified source (local or s3) """
-        collector = NBADataCollector()
-        dataset = collector.collect_dataset(seasons=seasons)
+        # One collector for the client's lifetime, repeated ingestions don't rebuild it
+        if self._collector is None:
+            self._collector = NBADataCollector()
+        dataset = self._collector.collect_dataset(seasons=seasons)
 
         if not dataset:
             logger.error("No data collected to store.")
@@ -30,7 +308,7 @@ class NBAApiClient:
 
         success = self.storage.save(dataset=dataset, prefix=prefix)
         if success:
-            cache.set(f"dataset:{prefix}", dataset)
+            self.clear_cached_data(prefix, dataset.keys())
 
         return success
  
@@ -54,16 +332,13 @@ class NBAApiClient:
             return True
 
         except Exception as e:
-            logger.error(f"Failed to setup NBA dataset: {e}")
+            logger.error("Failed to setup NBA dataset: %s", e)
             return False
         
     def get_player_stats(self, players: List[str], seasons: List[str]) -> pd.DataFrame:
         """ Get player stats for given players and seasons """
-        if not self.cached_data:
-            self.load_data()
-            
         # Get "player" dataframe that contains all the players stats
-        player_df = self.cached_data.get("player", pd.DataFrame())
+        player_df = self.get_dataset(PLAYER_STATS_DATASET)
         if player_df.empty:
             logger.warning("Player dataframe is empty.")
             return pd.DataFrame()
@@ -78,19 +353,13 @@ class NBAApiClient:
             logger.warning('Expected column "season" not found in player dataframe.')
             return pd.DataFrame()
         
-        filtered = player_df[
-            player_df[name_col].str.lower().isin([p.lower() for p in players]) &
-            player_df[season_col].isin(seasons)
-        ]
-        return filtered
+        players = self.resolve_names(players, "player", name_col, player_df)
+        return self._select_rows("player", player_df, players, seasons, name_col, season_col)
 
     def get_team_stats(self, teams: List[str], seasons: List[str]) -> pd.DataFrame:
         """ Get team stats for given teams and seasons """
-        if not self.cached_data:
-            self.load_data()
-            
         # Get "team" dataframe that contains all the teams stats
-        team_df = self.cached_data.get("team", pd.DataFrame())
+        team_df = self.get_dataset(TEAM_STATS_DATASET)
         if team_df.empty:
             logger.warning("Team dataframe is empty.")
             return pd.DataFrame()
@@ -105,31 +374,93 @@ class NBAApiClient:
             logger.warning('Expected column "season" not found in team dataframe.')
             return pd.DataFrame()
         
-        filtered = team_df[
-            team_df[name_col].str.lower().isin([t.lower() for t in teams]) &
-            team_df[season_col].isin(seasons)
-        ]
-        return filtered
-
-    def load_data(self, prefix: str = "nba-data", latest_only: bool = True) -> Dict[str, pd.DataFrame]:
-        """ Load data using the configured storage """
+        teams = self.resolve_names(teams, "team", name_col, team_df)
+        return self._select_rows("team", team_df, teams, seasons, name_col, season_col)
+
+    def get_top_players(self, seasons: List[str], stat: str, stats_type: str = "per_game", top_n: int = 10) -> pd.DataFrame:
+        """ Get the top N players by a stat ("points", "assists", ...) in each of the given seasons """
+        player_df = self.get_dataset(PLAYER_STATS_DATASET)
+        if player_df.empty or "season" not in player_df.columns:
+            logger.warning("Player dataframe is empty or has no season column.")
+            return pd.DataFrame()
+
+        column = resolve_stat_column(stat, stats_type, player_df.columns)
+        if column is None:
+            logger.warning("No column found for stat %s (%s).", stat, stats_type)
+            return pd.DataFrame()
+
+        season_col = "season"
+        # Rows are walked in the stat order sorted once per load, so no query sorts.
+        # Only the season column is read per query, the full width rows are taken for the top N alone
+        order = self.stat_order(PLAYER_STATS_DATASET, column, player_df)
+        ranked = order[player_df[season_col].isin(seasons).to_numpy()[order]]
+        codes, _ = pd.factorize(player_df[season_col], sort=False)
+        return player_df.iloc[ranked[first_n_per_group(codes[ranked], top_n)]]
+
+    def load_data(self, prefix: str = "nba-data", latest_only: bool = True, entities: Optional[List[str]] = None, downcast: bool = True) -> Dict[str, pd.DataFrame]:
+        """ Load data using the configured storage \n
+            `entities` limits the load to those datasets (e.g. ["player"]), each cached under its own key and added to the loaded data \n
+            `downcast` stores the numeric stats as 32-bit, pass False to keep the full 64-bit precision
+        """
         try:
+            self._sync_data_version(prefix)
             cache_key = f"dataset:{prefix}:latest" if latest_only else f"dataset:{prefix}:all"
-            cached = cache.get(cache_key)
+            if not downcast:
+                cache_key = f"{cache_key}:float64"
+            if entities is not None:
+                return self._load_entities(cache_key, prefix, latest_only, entities, downcast)
+
+            cached = self._mem_cache.get(cache_key)
 
             if cached:
-                logger.info(f"Loaded dataset from cache with key={cache_key}")
+                logger.info("Loaded dataset from cache with key=%s", cache_key)
+                if cached is not self.cached_data:
+                    self._reset_indexes()
                 self.cached_data = cached
                 return cached
-            
-            dataset = self.storage.load(prefix=prefix, latest_only=latest_only)
 
-            cache.set(cache_key, dataset)
-            self.cached_data = dataset
-            if not dataset:
+            # One loader per key, concurrent cold starts wait for it instead of all reading storage
+            dataset = cache.get_or_set(cache_key, lambda: prepare_dataset(self.storage.load(prefix=prefix, latest_only=latest_only), downcast))
+
+            if dataset:
+                self._mem_cache[cache_key] = dataset
+            else:
+                # Not kept, so data stored later is picked up by the next load
+                cache.delete(cache_key)
                 logger.warning("No data loaded from storage.")
+            if dataset is not self.cached_data:
+                self._reset_indexes()
+            self.cached_data = dataset
 
             return dataset
         except Exception as e:
-            logger.error(f"Failed to load data from storage: {e}")
-            return {}
\ No newline at end of file
+            logger.error("Failed to load data from storage: %s", e)
+            return {}
+
+    def _load_entities(self, cache_key: str, prefix: str, latest_only: bool, entities: List[str], downcast: bool) -> Dict[str, pd.DataFrame]:
+        """ Load some datasets, from the full cached dataset or their own cache entry first and from storage otherwise """
+        cached_dataset = self._cache_get(cache_key) or {}
+        loaded = {}
+        for entity in entities:
+            df = cached_dataset.get(entity)
+            loaded[entity] = df if df is not None else self._cache_get(f"{cache_key}:{entity}")
+
+        missing = [entity for entity, df in loaded.items() if df is None]
+        loaded = {entity: df for entity, df in loaded.items() if df is not None}
+        for entity in missing:
+            entity_key = f"{cache_key}:{entity}"
+            # Locked per entity, so callers missing overlapping sets still load each dataset once
+            with cache.lock(entity_key):
+                # Another caller may have loaded it while this one waited for the lock
+                df = self._cache_get(entity_key)
+                if df is None:
+                    df = prepare_dataset(self.storage.load(prefix=prefix, latest_only=latest_only, names=[entity]), downcast).get(entity)
+                    if df is None:
+                        logger.warning("No data loaded from storage for %s.", entity)
+                        continue
+                    self._cache_set(entity_key, df)
+                loaded[entity] = df
+
+        self._reset_indexes(entity for entity, df in loaded.items() if self.cached_data.get(entity) is not df)
+        self.cached_data = {**self.cached_data, **loaded}
+        return loaded
@@ -1,6 +1,10 @@
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 from datetime import date
-from typing import List, Dict, Optional
+from typing import Callable, List, Dict, Optional
 from ...core.settings import nba_settings
 from nba_api.stats.endpoints import (
     commonplayerinfo,
@@ -11,33 +15,126 @@ from nba_api.stats.endpoints import (
 )
 
 from nba_api.stats.static import players, teams
-import time
+from nba_api.stats.library.http import NBAStatsHTTP
+from requests import Session
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import compress
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def deduplicate_merged_columns(merged: pd.DataFrame, per_game: pd.DataFrame, totals: pd.DataFrame, merge_fields) -> pd.DataFrame:
+NBA_API_POOL_SIZE = 20
+
+# Minimum spacing between stats.nba.com requests, shared by every collection worker, the API throttles bursty clients
+NBA_API_MIN_REQUEST_INTERVAL = 0.6
+
+PLAYER_MERGE_FIELDS = ["PLAYER_ID", "PLAYER_NAME", "TEAM_ID", "TEAM_ABBREVIATION"]
+
+# Stats shown side by side when comparing players, as named in the joined per-game and totals frame
+DEFAULT_COMPARE_COLS = [
+    "GP", "MIN_PER_GAME", "PTS_PER_GAME", "REB_PER_GAME", "AST_PER_GAME",
+    "STL_PER_GAME", "BLK_PER_GAME", "FG_PCT", "FG3_PCT", "FT_PCT",
+]
+
+# Stats of finished seasons never change, their responses are kept here and read back instead of re-fetched
+RESPONSE_CACHE_DIR = os.path.join("data", ".cache")
+
+class RequestRateLimiter:
     """
-    Remove duplicate columns from merged per-game and totals DataFrames.
-    Keeps one version if values are identical across both,
-    otherwise leaves both with suffixes.
+    Spaces calls at least `min_interval` seconds apart across threads. \n
+    Each caller reserves the next free slot under the lock and sleeps outside it, so waiting workers don't hold each other up.
     """
-    for col in per_game.columns:
-        if (
-            col in totals.columns
-            and col not in merge_fields
-        ):
-            col_pg = f"{col}_PER_GAME"
-            col_tot = f"{col}_TOTALS"
-
-            if col_pg in merged.columns and col_tot in merged.columns:
-                # If values are identical, keep one and drop the other
-                if merged[col_pg].equals(merged[col_tot]):
-                    merged[col] = merged[col_pg]  # restore original name
-                    merged = merged.drop(columns=[col_pg, col_tot])
-    
-    return merged
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.min_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def configure_http_session(pool_size: int = NBA_API_POOL_SIZE) -> Session:
+    """
+    Give nba_api a shared keep-alive session with a connection pool large enough
+    for concurrent endpoint calls (the requests default keeps 10 connections per host).
+    """
+    session = Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    NBAStatsHTTP.set_session(session)
+    return session
+
+configure_http_session()
+
+def concat_nonempty(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Stack per-season frames in one concat, an empty frame when there are none. \n
+    Frames are collected into a list first and joined once here, appending in the loop would copy
+    every earlier season again on each iteration.
+    """
+    return pd.concat(frames, ignore_index=True, copy=False) if frames else pd.DataFrame()
+
+@lru_cache(maxsize=1)
+def _all_players_df() -> pd.DataFrame:
+    """ The player list shipped with nba_api, it never changes while the process runs so it is built once """
+    return pd.DataFrame(players.get_players())
+
+@lru_cache(maxsize=1)
+def _all_teams_df() -> pd.DataFrame:
+    """ The team list shipped with nba_api, built once like the players """
+    return pd.DataFrame(teams.get_teams())
+
+def narrow_integers(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store the int64 columns of a fetched frame (ids, GP, W, FGM, ...) as int32 where the values fit. \n
+    Lossless, unlike float32, so it is done before saving, floats are only narrowed in memory when loaded.
+    """
+    int32 = np.iinfo(np.int32)
+    columns = [
+        column for column, dtype in df.dtypes.items()
+        if dtype == np.int64 and df[column].min() >= int32.min and df[column].max() <= int32.max
+    ]
+    return df.astype(dict.fromkeys(columns, np.int32)) if columns else df
+
+def merge_per_game_and_totals(per_game: pd.DataFrame, totals: pd.DataFrame, merge_fields: List[str]) -> pd.DataFrame:
+    """
+    Join the per-game and totals frames of an endpoint row by row on `merge_fields`, inner and one to one.
+    Stats identical in both (GP, W_PCT, ...) are kept once under their own name,
+    the others get a _PER_GAME / _TOTALS suffix.
+    """
+    per_game = per_game.set_index(merge_fields)
+    totals = totals.set_index(merge_fields)
+    # One row per key on each side (validate="one_to_one"), a repeated key would otherwise fan out the join
+    for name, frame in (("per-game", per_game), ("totals", totals)):
+        if not frame.index.is_unique:
+            duplicates = frame.index[frame.index.duplicated()].unique()[:5].tolist()
+            raise pd.errors.MergeError(f"Duplicate {merge_fields} keys in {name} stats: {duplicates}")
+    # Rows of both frames in per-game order, as an inner merge would give them
+    per_game = per_game[per_game.index.isin(totals.index)]
+    totals = totals.reindex(per_game.index)
+
+    shared = [col for col in per_game.columns if col in totals.columns]
+    per_game_shared, totals_shared = per_game[shared], totals[shared]
+    # One elementwise comparison of every shared column, NaN matching NaN as Series.equals does
+    same_values = (per_game_shared.to_numpy() == totals_shared.to_numpy()) | (per_game_shared.isna().to_numpy() & totals_shared.isna().to_numpy())
+    same_dtypes = per_game_shared.dtypes.to_numpy() == totals_shared.dtypes.to_numpy()
+    identical = set(compress(shared, same_values.all(axis=0) & same_dtypes))
+    suffixed = [col for col in shared if col not in identical]
+
+    merged = pd.concat([
+        per_game.rename(columns={col: f"{col}_PER_GAME" for col in suffixed}),
+        totals.drop(columns=list(identical)).rename(columns={col: f"{col}_TOTALS" for col in suffixed}),
+    ], axis=1)
+    return merged.reset_index()
 
 
 class NBADataCollector:
@@ -47,12 +144,59 @@ class NBADataCollector:
     Do not use this class for serving user queries in real-time.
     """
 
+    # Endpoint calls in flight at once over the shared session, their start times are still spaced by the rate limiter
+    COLLECT_MAX_WORKERS = 4
+
+    def __init__(self, cache_dir: Optional[str] = RESPONSE_CACHE_DIR, min_request_interval: float = NBA_API_MIN_REQUEST_INTERVAL):
+        """
+        `cache_dir` holds the season stats of past seasons, None turns the cache off \n
+        `min_request_interval` is the spacing between endpoint requests, whichever worker makes them
+        """
+        self.cache_dir = cache_dir
+        self.rate_limiter = RequestRateLimiter(min_request_interval)
+
+    def _league_dash(self, endpoint: Callable, **params) -> pd.DataFrame:
+        """ First frame of a LeagueDash endpoint, requested once the rate limiter allows it """
+        self.rate_limiter.wait()
+        return endpoint(**params).get_data_frames()[0]
+
+    def _cached_fetch(self, key: str, season: str, fetch_fn: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """
+        Return the season frame stored under `key` in the cache directory, or fetch and store it. \n
+        The current season is still being played, so it is always fetched.
+        """
+        if not self.cache_dir or season == nba_settings.get_current_season():
+            return fetch_fn()
+
+        path = os.path.join(self.cache_dir, f"{key}.parquet")
+        if os.path.exists(path):
+            logger.info(f"Using cached {key} from {path}")
+            return pd.read_parquet(path)
+
+        df = fetch_fn()
+        if not df.empty:
+            # Written next to the target and renamed, a concurrent reader never sees a partial file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                df.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, path)
+            except Exception as e:
+                # The frame was fetched fine, failing to cache it (disk or a column Arrow can't write) only costs a refetch
+                logger.warning(f"Could not cache {key} to {path}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        return df
+
     def get_all_players(self) -> pd.DataFrame:
         """ Get a list of all NBA players. """
         try:
-            all_players = players.get_players()
+            all_players = _all_players_df()
             logger.info("Successfully retrieved all NBA players.")
-            return pd.DataFrame(all_players)
+            # Shallow copy, callers adding or dropping columns leave the cached frame alone
+            return all_players.copy(deep=False)
         except Exception as e:
             logger.error(f"Error retrieving NBA players: {e}")
             return pd.DataFrame()
@@ -60,9 +204,9 @@ class NBADataCollector:
     def get_all_teams(self) -> pd.DataFrame:
         """ Get a list of all NBA teams. """
         try:
-            all_teams = teams.get_teams()
+            all_teams = _all_teams_df()
             logger.info("Successfully retrieved all NBA teams.")
-            return pd.DataFrame(all_teams)
+            return all_teams.copy(deep=False)
         except Exception as e:
             logger.error(f"Error retrieving NBA teams: {e}")
             return pd.DataFrame()
@@ -72,82 +216,79 @@ class NBADataCollector:
         Get comprehensive player stats for a given season \n
         Season format: "2023-24"
         """
+        season = season or nba_settings.DEFAULT_SEASON
         try:
-            logger.info(f"Fetching player stats for season {season}")
-            season = season or nba_settings.DEFAULT_SEASON
-
-            per_game = leaguedashplayerstats.LeagueDashPlayerStats(
-                season=season,
-                per_mode_detailed="PerGame",
-                
-                season_type_all_star="Regular Season",
-            ).get_data_frames()[0]
-
-            totals = leaguedashplayerstats.LeagueDashPlayerStats(
-                season=season,
-                per_mode_detailed="Totals",
-                
-                season_type_all_star="Regular Season",
-            ).get_data_frames()[0]
-            
-            merge_fields = ["PLAYER_ID", "PLAYER_NAME", "TEAM_ID", "TEAM_ABBREVIATION"]
-            
-            merged_stats = pd.merge(
-                per_game,
-                totals,
-                on=merge_fields,
-                suffixes=('_PER_GAME', '_TOTALS')
-            )       
-            merged_stats = deduplicate_merged_columns(merged_stats, per_game, totals, merge_fields)       
-
-            merged_stats["season"] = season
-            return merged_stats
-
+            return self._cached_fetch(f"player_stats_{season}", season, lambda: self._fetch_players_season_stats(season))
         except Exception as e:
             logger.error(f"Error retrieving player stats for season {season}: {e}")
             return pd.DataFrame()
+
+    def _fetch_players_season_stats(self, season: str) -> pd.DataFrame:
+        """ Request the per-game and totals player stats of a season and join them """
+        logger.info(f"Fetching player stats for season {season}")
+
+        per_game = self._league_dash(
+            leaguedashplayerstats.LeagueDashPlayerStats,
+            season=season,
+            per_mode_detailed="PerGame",
+            
+            season_type_all_star="Regular Season",
+        )
+
+        totals = self._league_dash(
+            leaguedashplayerstats.LeagueDashPlayerStats,
+            season=season,
+            per_mode_detailed="Totals",
+            
+            season_type_all_star="Regular Season",
+        )
+        
+        merged_stats = narrow_integers(merge_per_game_and_totals(per_game, totals, PLAYER_MERGE_FIELDS))
+
+        merged_stats["season"] = season
+        return merged_stats
         
     def get_team_stats(self, season: str = None) -> pd.DataFrame:
         """
         Get comprehensive team stats for a given season \n
         Season format: "2023-24"
         """
+        season = season or nba_settings.DEFAULT_SEASON
         try:
-            season = season or nba_settings.DEFAULT_SEASON
-            logger.info(f"Fetching team stats for season {season}")
-
-            per_game_team_stats = leaguedashteamstats.LeagueDashTeamStats(
-                season=season,
-                per_mode_detailed="PerGame",
-                season_type_all_star="Regular Season",
-            ).get_data_frames()[0]
-            
-            totals_team_stats = leaguedashteamstats.LeagueDashTeamStats(
-                season=season,
-                per_mode_detailed="Totals",
-                season_type_all_star="Regular Season",
-            ).get_data_frames()[0]
-
-            merged_fields = ["TEAM_ID", "TEAM_NAME"]
-            merged_team_stats = pd.merge(
-                per_game_team_stats,
-                totals_team_stats,
-                on=merged_fields,
-                suffixes=('_PER_GAME', '_TOTALS')
-            )
-
-            df = deduplicate_merged_columns(merged_team_stats, per_game_team_stats, totals_team_stats, merged_fields)
-
-            df["season"] = season
-            return df
+            return self._cached_fetch(f"team_stats_{season}", season, lambda: self._fetch_team_stats(season))
         except Exception as e:
             logger.error(f"Error retrieving team stats for season {season}: {e}")
             return pd.DataFrame()
+
+    def _fetch_team_stats(self, season: str) -> pd.DataFrame:
+        """ Request the per-game and totals team stats of a season and join them """
+        logger.info(f"Fetching team stats for season {season}")
+
+        per_game_team_stats = self._league_dash(
+            leaguedashteamstats.LeagueDashTeamStats,
+            season=season,
+            per_mode_detailed="PerGame",
+            season_type_all_star="Regular Season",
+        )
+        
+        totals_team_stats = self._league_dash(
+            leaguedashteamstats.LeagueDashTeamStats,
+            season=season,
+            per_mode_detailed="Totals",
+            season_type_all_star="Regular Season",
+        )
+
+        merged_fields = ["TEAM_ID", "TEAM_NAME"]
+        df = narrow_integers(merge_per_game_and_totals(per_game_team_stats, totals_team_stats, merged_fields))
+
+        df["season"] = season
+        return df
         
     def get_player_career_stats(self, player_id: int) -> pd.DataFrame:
         """Get career stats for a specific player"""
 
         try: 
+            self.rate_limiter.wait()
             career_stats = playercareerstats.PlayerCareerStats(player_id=player_id)
             df = career_stats.get_data_frames()[0]
             return df
@@ -170,65 +311,58 @@ class NBADataCollector:
         dataset['players'] = self.get_all_players()
         dataset['teams'] = self.get_all_teams()
 
-        # Get Seasonal data
-        all_player_stats = []
-        all_team_stats = []
+        # Get Seasonal data, every season's player and team requests run concurrently
+        logger.info(f"Collecting data for seasons {seasons}...")
+        with ThreadPoolExecutor(max_workers=max(1, min(self.COLLECT_MAX_WORKERS, 2 * len(seasons)))) as pool:
+            player_stats = pool.map(self.get_all_players_season_stats, seasons)
+            team_stats = pool.map(self.get_team_stats, seasons)
 
-        for season in seasons:
-            logger.info(f"Collecting data for season {season}...")
-
-            # Player stats Per Game
-            player_stats = self.get_all_players_season_stats(season)
-            if not player_stats.empty:
-                all_player_stats.append(player_stats)
-
-
-            # Team stats
-            team_stats = self.get_team_stats(season)
-            if not team_stats.empty:
-                all_team_stats.append(team_stats)
-
-            # Just in case there is rate limits
-            time.sleep(1)
+            # map keeps season order, so the combined frames are ordered as before
+            all_player_stats = [df for df in player_stats if not df.empty]
+            all_team_stats = [df for df in team_stats if not df.empty]
 
         # Combine all seasons
         if all_player_stats:
-            dataset['player_stats'] = pd.concat(all_player_stats, ignore_index=True)
+            dataset['player_stats'] = concat_nonempty(all_player_stats)
 
         if all_team_stats:
-            dataset['team_stats'] = pd.concat(all_team_stats, ignore_index=True)
+            dataset['team_stats'] = concat_nonempty(all_team_stats)
 
         return dataset
     
-    def get_player_season_comparison_data(self, player_names: List[str], seasons: List[str] = None) -> pd.DataFrame:
+    def get_player_season_comparison_data(self, player_names: List[str], seasons: List[str] = None, stat_cols: Optional[List[str]] = None) -> pd.DataFrame:
         """
-        Get stats for specific players for comparison
+        Get stats for specific players for comparison \n
+        Only the `stat_cols` stats (DEFAULT_COMPARE_COLS by default) are kept next to the player and season columns.
         """
 
         if seasons is None:
             seasons = [nba_settings.DEFAULT_SEASON]
 
+        columns = PLAYER_MERGE_FIELDS + (stat_cols or DEFAULT_COMPARE_COLS) + ["season"]
+        name_set = frozenset(player_names)
+
         try:
             comparison_data = []
 
             for season in seasons:
-                season_stats = self.get_season_player_stats(season)
+                season_stats = self.get_all_players_season_stats(season)
 
                 if season_stats.empty:
                     return pd.DataFrame()
-                
-                season_comparison = season_stats[
-                    season_stats['PLAYER_NAME'].isin(player_names)
-                ]
+
+                # Narrowed to the compared columns first, so the row filter only copies those
+                season_stats = season_stats[[col for col in columns if col in season_stats.columns]]
+                # Plain set lookups over the few hundred names of a season, Series.isin overhead outweighs its work here
+                names = season_stats['PLAYER_NAME'].to_numpy()
+                season_comparison = season_stats[np.fromiter((name in name_set for name in names), dtype=bool, count=len(names))]
 
                 if not season_comparison.empty:
                     comparison_data.append(season_comparison)
 
-            if comparison_data:
-                return pd.concat(comparison_data, ignore_index=True)
-            else:
+            if not comparison_data:
                 logger.warning("No comparison data found for the given players and seasons.")
-                return pd.DataFrame()
+            return concat_nonempty(comparison_data)
 
         except Exception as e:
             logger.error(f"Error retrieving player comparison data: {e}")
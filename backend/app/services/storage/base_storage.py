@@ -1,7 +1,41 @@
 from abc import ABC, abstractmethod
-from typing import Dict
+from typing import Any, Dict, Iterable, Optional, Tuple
 import pandas as pd
 
+# Datasets are written as Parquet, CSV files from older runs are still loaded
+DATASET_EXTENSIONS = (".parquet", ".csv")
+PARQUET_COMPRESSION = "zstd"
+
+# Formats a dataset can be saved in, Parquet and CSV are read back (DATASET_EXTENSIONS), JSON is only for reading the files by hand
+SAVE_FORMATS = ("parquet", "csv", "json")
+DEFAULT_SAVE_FORMATS = ("parquet",)
+
+def check_save_formats(formats: Iterable[str]) -> Tuple[str, ...]:
+    """ Validated tuple of save formats, raises ValueError for a format not in SAVE_FORMATS or a set `load()` could not read back """
+    formats = tuple(formats)
+    unknown = [file_format for file_format in formats if file_format not in SAVE_FORMATS]
+    if unknown:
+        raise ValueError(f"Unsupported dataset formats {unknown}, expected some of {SAVE_FORMATS}")
+    loadable = [extension.lstrip(".") for extension in DATASET_EXTENSIONS]
+    if not any(file_format in loadable for file_format in formats):
+        raise ValueError(f"Dataset formats {list(formats)} can't be loaded back, include one of {loadable}")
+    return formats
+
+def write_dataset_file(df: pd.DataFrame, file_format: str, target: Any):
+    """ Serialize a dataset frame in one of SAVE_FORMATS straight into `target` (path or binary file), without an intermediate string """
+    if file_format == "parquet":
+        df.to_parquet(target, index=False, compression=PARQUET_COMPRESSION)
+    elif file_format == "csv":
+        df.to_csv(target, index=False)
+    else:
+        # Compact records, indenting only made the files several times larger
+        df.to_json(target, orient="records")
+
+def read_dataset_file(source: Any, filename: str) -> pd.DataFrame:
+    """ Read a stored dataset file (path or file-like), the parser is picked from the file extension """
+    if filename.endswith(".parquet"):
+        return pd.read_parquet(source)
+    return pd.read_csv(source)
 
 class BaseStorage(ABC):
     """
@@ -12,5 +46,5 @@ class BaseStorage(ABC):
         pass
     
     @abstractmethod
-    def load(self, prefix: str, latest_only: bool) -> Dict[str, pd.DataFrame]:
+    def load(self, prefix: str, latest_only: bool, names: Optional[Iterable[str]] = None) -> Dict[str, pd.DataFrame]:
         pass
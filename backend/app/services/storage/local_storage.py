@@ -1,10 +1,10 @@
 import pandas as pd
 import os
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterable, Optional
 import logging
 
-from .base_storage import BaseStorage
+from .base_storage import BaseStorage, DATASET_EXTENSIONS, DEFAULT_SAVE_FORMATS, check_save_formats, read_dataset_file, write_dataset_file
 
 logger = logging.getLogger(__name__)
 
@@ -13,8 +13,9 @@ class LocalStorage(BaseStorage):
     Handles local data storage operations
     """
 
-    def __init__(self, base_directory: str = "data"):
+    def __init__(self, base_directory: str = "data", formats: Iterable[str] = DEFAULT_SAVE_FORMATS):
         self.base_directory = base_directory
+        self.formats = check_save_formats(formats)
 
     def save(self, dataset: Dict[str, pd.DataFrame], prefix: str = "nba-data") -> bool:
         """
@@ -30,24 +31,25 @@ class LocalStorage(BaseStorage):
                 if df.empty:
                     continue
 
-                csv_path = os.path.join(directory, f"{name}_{timestamp}.csv")
-                json_path = os.path.join(directory, f"{name}_{timestamp}.json")
-                
-                df.to_csv(csv_path, index=False)
-                df.to_json(json_path, orient="records", indent=2)
+                paths = []
+                for file_format in self.formats:
+                    path = os.path.join(directory, f"{name}_{timestamp}.{file_format}")
+                    write_dataset_file(df, file_format, path)
+                    paths.append(path)
 
-                logger.info(f"Saved {name} locally as {csv_path} and {json_path}")
+                logger.info(f"Saved {name} locally as {', '.join(paths)}")
 
             return True
         except Exception as e:
             logger.error(f"Failed to save data locally: {e}")
             return False
 
-    def load(self, prefix: str = "nba-data", latest_only: bool = True) -> Dict[str, pd.DataFrame]:
+    def load(self, prefix: str = "nba-data", latest_only: bool = True, names: Optional[Iterable[str]] = None) -> Dict[str, pd.DataFrame]:
         """
-        Load the dataset from local file system.
+        Load the dataset from local file system, only the datasets in `names` when given.
         """
         dataset = {}
+        names = None if names is None else set(names)
         
         try:
             directory = os.path.join(self.base_directory, prefix)
@@ -56,32 +58,30 @@ class LocalStorage(BaseStorage):
                 logger.warning(f"Directory {directory} does not exist.")
                 return dataset
 
-            csv_files = {}
-            
-            # Group files by dataset name
+            # Pick the file to load per dataset in one pass, the newest one or the first listed
+            paths = {}
+            modified = {}
             for filename in os.listdir(directory):
-                if filename.endswith(".csv"):
-                    file_path = os.path.join(directory, filename)
-                    dataset_name = filename.replace('.csv', '').split('_')[0]
-                    
-                    if dataset_name not in csv_files:
-                        csv_files[dataset_name] = []
-                    
-                    csv_files[dataset_name].append({
-                        'path': file_path,
-                        'modified': os.path.getmtime(file_path)
-                    })
+                if not filename.endswith(DATASET_EXTENSIONS):
+                    continue
+                dataset_name = filename.rsplit('.', 1)[0].split('_', 1)[0]
+                if names is not None and dataset_name not in names:
+                    continue
 
-            # Load datasets (latest if specified)
-            for dataset_name, files in csv_files.items():
-                if latest_only:
-                    latest_file = max(files, key=lambda x: x['modified'])
-                    file_path = latest_file['path']
-                else:
-                    # Just take the first file
-                    file_path = files[0]['path']
-                
-                df = pd.read_csv(file_path)
+                file_path = os.path.join(directory, filename)
+                if dataset_name not in paths:
+                    paths[dataset_name] = file_path
+                    # Modification times are only read when they decide between files
+                    if latest_only:
+                        modified[dataset_name] = os.path.getmtime(file_path)
+                elif latest_only:
+                    file_modified = os.path.getmtime(file_path)
+                    if file_modified > modified[dataset_name]:
+                        paths[dataset_name] = file_path
+                        modified[dataset_name] = file_modified
+
+            for dataset_name, file_path in paths.items():
+                df = read_dataset_file(file_path, file_path)
                 dataset[dataset_name] = df
                 
                 logger.info(f"Loaded {dataset_name} from {file_path}")
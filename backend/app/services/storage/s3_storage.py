@@ -1,21 +1,46 @@
+import io
 import pandas as pd
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 import logging
 
-from .base_storage import BaseStorage
+from .base_storage import BaseStorage, DATASET_EXTENSIONS, DEFAULT_SAVE_FORMATS, check_save_formats, read_dataset_file, write_dataset_file
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=1)
+def _shared_s3_client():
+    """
+    One S3 client for every S3Storage, its connection pool and credentials are reused rather than rebuilt per instance. \n
+    The pool holds one connection per transfer worker (botocore keeps only 10 by default),
+    adaptive retries back off when S3 throttles the concurrent requests.
+    """
+    return boto3.client('s3', config=Config(
+        max_pool_connections=S3Storage.LOAD_MAX_WORKERS,
+        retries={"max_attempts": 10, "mode": "adaptive"},
+        tcp_keepalive=True,
+    ))
+
 class S3Storage(BaseStorage):
     """
     AWS S3 storage implementation.
     """
 
-    def __init__(self, s3_bucket: str):
+    # Upper bound on concurrent object downloads when loading a dataset, and uploads when saving one
+    LOAD_MAX_WORKERS = 16
+
+    # Objects past 8 MB are sent as multipart uploads, their parts overlapping each other
+    UPLOAD_CONFIG = TransferConfig(multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024, max_concurrency=4)
+
+    def __init__(self, s3_bucket: str, formats: Iterable[str] = DEFAULT_SAVE_FORMATS):
         self.s3_bucket = s3_bucket
-        self.s3_client = boto3.client('s3') if s3_bucket else None
+        self.formats = check_save_formats(formats)
+        self.s3_client = _shared_s3_client() if s3_bucket else None
 
 
     def save(self, dataset: Dict[str, pd.DataFrame], prefix: str = "nba-data") -> bool:
@@ -25,42 +50,53 @@ class S3Storage(BaseStorage):
         
         try:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            for name, df in dataset.items():
-                if df.empty:
-                    continue
-
-                # Save as CSV
-                csv_key = f"{prefix}/{name}_{timestamp}.csv"
-                csv_buffer = df.to_csv(index=False).encode('utf-8')
-                self.s3_client.put_object(
-                    Bucket=self.s3_bucket,
-                    Key=csv_key,
-                    Body=csv_buffer,
-                )
-
-                # Save as JSON for easier querying
+            uploads = [
+                (f"{prefix}/{name}_{timestamp}.{file_format}", df, file_format)
+                for name, df in dataset.items() if not df.empty
+                for file_format in self.formats
+            ]
 
-                json_key = f"{prefix}/{name}_{timestamp}.json"
-                json_buffer = df.to_json(orient="records", indent=2).encode('utf-8')
-                self.s3_client.put_object(
-                    Bucket=self.s3_bucket,
-                    Key=json_key,
-                    Body=json_buffer,
-                )
-
-                logger.info(f"Saved {name} to S3 as {csv_key} and {json_key}")
+            # Encode and upload every object concurrently, list() re-raises the first failed upload
+            with ThreadPoolExecutor(max_workers=max(1, min(self.LOAD_MAX_WORKERS, len(uploads)))) as pool:
+                for key in list(pool.map(self._write_file, uploads)):
+                    logger.info(f"Saved {key} to S3")
 
             return True
         except Exception as e:
             logger.error(f"Failed to save data to S3: {e}")
             return False
         
-    def load(self, prefix: str = "nba-data", latest_only: bool = True) -> Dict[str, pd.DataFrame]:
+    def _write_file(self, upload: Tuple[str, pd.DataFrame, str]) -> str:
+        key, df, file_format = upload
+        # Encoded once into a bytes buffer that is uploaded as is
+        buffer = io.BytesIO()
+        write_dataset_file(df, file_format, buffer)
+        buffer.seek(0)
+        self.s3_client.upload_fileobj(buffer, self.s3_bucket, key, Config=self.UPLOAD_CONFIG)
+        return key
+
+    def _read_file(self, key: str) -> pd.DataFrame:
+        response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=key)
+        # Parquet needs a seekable buffer, the streaming body is not
+        return read_dataset_file(io.BytesIO(response['Body'].read()), key)
+
+    def _list_objects(self, prefix: str) -> List[Dict[str, Any]]:
+        """ Every object under a prefix, following continuation tokens past the 1000 keys one listing returns """
+        objects = []
+        request = {"Bucket": self.s3_bucket, "Prefix": prefix}
+        while True:
+            response = self.s3_client.list_objects_v2(**request)
+            objects.extend(response.get('Contents', []))
+            if not response.get('IsTruncated'):
+                return objects
+            request["ContinuationToken"] = response['NextContinuationToken']
+
+    def load(self, prefix: str = "nba-data", latest_only: bool = True, names: Optional[Iterable[str]] = None) -> Dict[str, pd.DataFrame]:
         """
-        Load the dataset from S3.
+        Load the dataset from S3, only the datasets in `names` are downloaded when given.
         """
         dataset = {}
+        names = None if names is None else set(names)
 
         if not self.s3_client or not self.s3_bucket:
             logger.error("S3 client or bucket not configured.")
@@ -68,42 +104,33 @@ class S3Storage(BaseStorage):
         
         try:
             # List objects in the specified S3 bucket and prefix
-            response = self.s3_client.list_objects_v2(Bucket=self.s3_bucket, Prefix=prefix)
+            objects = self._list_objects(prefix)
 
-            if 'Contents' not in response:
+            if not objects:
                 logger.warning(f"No objects found in S3 bucket {self.s3_bucket} with prefix {prefix}.")
                 return dataset
             
-            csv_files = {}
-            # Group files by name
-            for obj in response['Contents']:
+            # Pick the file to load per dataset in one pass over the listing, the newest one or the first listed
+            keys = {}
+            modified = {}
+            for obj in objects:
                 key = obj['Key']
-                if key.endswith('.csv'):
-                    filename = key.split('/')[-1]
-                    dataset_name = filename.split('_')[0]
-                    
-                    if dataset_name not in csv_files:
-                        csv_files[dataset_name] = []
-
-                    csv_files[dataset_name].append({
-                        'Key': key,
-                        'modified': obj['LastModified']
-                    })
-
-            # Load datasets (latest if specified)
-            for dataset_name, files in csv_files.items():
-                if latest_only:
-                    latest_file = max(files, key=lambda x: x['modified'])
-                    key = latest_file['Key']
-                else:
-                    # Just take the first file
-                    key = files[0]['Key']
-                
-                # Download and load the CSV
-                response = self.s3_client.get_object(Bucket=self.s3_bucket, Key=key)
-                df = pd.read_csv(response['Body'])
-                dataset[dataset_name] = df
-                logger.info(f"Loaded {dataset_name} from S3 key {key}")
+                if not key.endswith(DATASET_EXTENSIONS):
+                    continue
+                dataset_name = key.rsplit('/', 1)[-1].split('_', 1)[0]
+                if names is not None and dataset_name not in names:
+                    continue
+
+                if dataset_name not in keys or (latest_only and obj['LastModified'] > modified[dataset_name]):
+                    keys[dataset_name] = key
+                    modified[dataset_name] = obj['LastModified']
+
+            # Download and parse the files concurrently, the boto3 client is thread-safe
+            with ThreadPoolExecutor(max_workers=max(1, min(self.LOAD_MAX_WORKERS, len(keys)))) as pool:
+                frames = pool.map(self._read_file, keys.values())
+                for (dataset_name, key), df in zip(keys.items(), frames):
+                    dataset[dataset_name] = df
+                    logger.info(f"Loaded {dataset_name} from S3 key {key}")
             
             return dataset
         except Exception as e:
@@ -0,0 +1,202 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.api.routes import get_query_processor, nba_client
+from app.core.settings import NBASettings
+from app.core.cache import cache
+from app.services.llm.query_processor import ERROR_ANSWER, NO_DATA_ANSWER, question_cache_key
+
+PROCESSOR_PATH = "app.api.routes.QueryProcessor"
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    get_query_processor.cache_clear()
+
+@pytest.fixture
+def client():
+    # Keep a single event loop for the whole test so the query batcher worker is reused
+    with TestClient(app) as test_client:
+        yield test_client
+
+def make_fake_processor(answer="42 points"):
+    """Return a FakeProcessor class that counts how many questions reached the LLM."""
+    class FakeProcessor:
+        calls = []
+        instances = 0
+
+        def __init__(self, storage, nba_client=None):
+            self.storage = storage
+            self.nba_client = nba_client
+            FakeProcessor.instances += 1
+
+        async def abatch_query(self, questions):
+            FakeProcessor.calls.extend(questions)
+            return [answer for _ in questions]
+
+        async def astream_query(self, question):
+            FakeProcessor.calls.append(question)
+            for word in answer.split(" "):
+                yield word + " "
+
+    return FakeProcessor
+
+def test_query_success(monkeypatch, client):
+    processor = make_fake_processor()
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    response = client.post("/api/v1/query", json={"question": "How many points did LeBron score?"})
+
+    assert response.status_code == 200
+    assert response.json() == {"answer": "42 points"}
+
+def test_query_repeated_question_served_from_cache(monkeypatch, client):
+    processor = make_fake_processor()
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    client.post("/api/v1/query", json={"question": "How many points did LeBron score?"})
+    response = client.post("/api/v1/query", json={"question": "  how many points did  LeBron score? "})
+
+    assert response.json() == {"answer": "42 points"}
+    assert len(processor.calls) == 1
+
+def test_query_processor_reused_across_requests(monkeypatch, client):
+    processor = make_fake_processor()
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    client.post("/api/v1/query", json={"question": "Who won?"})
+    client.post("/api/v1/query", json={"question": "Who lost?"})
+
+    assert len(processor.calls) == 2
+    assert processor.instances == 1
+
+def test_query_processor_shares_route_nba_client(monkeypatch):
+    monkeypatch.setattr(PROCESSOR_PATH, make_fake_processor())
+
+    assert get_query_processor().nba_client is nba_client
+
+def test_query_fallback_answer_not_cached(monkeypatch, client):
+    processor = make_fake_processor(answer=NO_DATA_ANSWER)
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    client.post("/api/v1/query", json={"question": "Who won?"})
+    client.post("/api/v1/query", json={"question": "Who won?"})
+
+    assert len(processor.calls) == 2
+
+def test_query_exception(monkeypatch, client):
+    class BadProcessor:
+        def __init__(self, storage, nba_client=None):
+            pass
+
+        async def abatch_query(self, questions):
+            raise RuntimeError("LLM error")
+
+    monkeypatch.setattr(PROCESSOR_PATH, BadProcessor)
+
+    response = client.post("/api/v1/query", json={"question": "Who won?"})
+
+    assert response.status_code == 500
+    assert response.json()["detail"] == "LLM error"
+
+def test_query_stream(monkeypatch, client):
+    processor = make_fake_processor(answer="LeBron scored\n42 points")
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    response = client.post("/api/v1/query/stream", json={"question": "Who won?"})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.text == "data: LeBron \n\ndata: scored\ndata: 42 \n\ndata: points \n\n"
+
+def test_query_stream_caches_full_answer(monkeypatch, client):
+    processor = make_fake_processor(answer="42 points")
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    client.post("/api/v1/query/stream", json={"question": "Who won?"})
+    response = client.post("/api/v1/query", json={"question": "Who won?"})
+
+    assert response.json() == {"answer": "42 points "}
+    assert len(processor.calls) == 1
+
+def test_query_stream_error(monkeypatch, client):
+    class BadProcessor:
+        def __init__(self, storage, nba_client=None):
+            pass
+
+        async def astream_query(self, question):
+            raise RuntimeError("LLM error")
+            yield
+
+    monkeypatch.setattr(PROCESSOR_PATH, BadProcessor)
+
+    response = client.post("/api/v1/query/stream", json={"question": "Who won?"})
+
+    assert response.text == f"data: {ERROR_ANSWER}\n\n"
+
+class FakeNBAClient:
+    def __init__(self, success=True):
+        self.success = success
+        self.seasons = None
+
+    def setup_nba_dataset(self, seasons=None):
+        self.seasons = seasons
+        return self.success
+
+def test_setup_dataset_runs_in_background(monkeypatch, client):
+    nba_client = FakeNBAClient()
+    monkeypatch.setattr("app.api.routes.nba_client", nba_client)
+
+    response = client.post("/api/v1/setup-dataset", json={"seasons": ["2023-24"]})
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["status"] == "accepted"
+
+    # TestClient runs background tasks before returning, so the job has finished
+    status = client.get(f"/api/v1/setup-dataset/{body['job_id']}")
+    assert status.json() == {"job_id": body["job_id"], "status": "completed", "seasons": ["2023-24"]}
+    assert nba_client.seasons == ["2023-24"]
+
+def test_setup_dataset_failed_job(monkeypatch, client):
+    monkeypatch.setattr("app.api.routes.nba_client", FakeNBAClient(success=False))
+
+    job_id = client.post("/api/v1/setup-dataset", json={}).json()["job_id"]
+
+    status = client.get(f"/api/v1/setup-dataset/{job_id}")
+    assert status.json()["status"] == "failed"
+
+def test_setup_dataset_unknown_job(client):
+    response = client.get("/api/v1/setup-dataset/unknown")
+
+    assert response.status_code == 404
+
+def test_large_response_is_gzipped(monkeypatch, client):
+    processor = make_fake_processor(answer="LeBron James " * 200)
+    monkeypatch.setattr(PROCESSOR_PATH, processor)
+
+    response = client.post("/api/v1/query", json={"question": "Who won?"}, headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json() == {"answer": "LeBron James " * 200}
+
+def test_small_response_not_gzipped(client):
+    response = client.get("/api/v1/health", headers={"Accept-Encoding": "gzip"})
+
+    assert "content-encoding" not in response.headers
+
+def test_query_cache_key_normalizes_question():
+    assert question_cache_key("query", "Who  won the title?") == question_cache_key("query", " who won the TITLE? ")
+
+def test_question_cache_key_scoped_by_prefix():
+    assert question_cache_key("query", "Who won the title?") != question_cache_key("analysis", "Who won the title?")
+
+def test_query_cache_key_changes_with_season(monkeypatch):
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2023-24"))
+    key_2023 = question_cache_key("query", "Who won the title?")
+
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2024-25"))
+    key_2024 = question_cache_key("query", "Who won the title?")
+
+    assert key_2023 != key_2024
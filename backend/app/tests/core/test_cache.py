@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+import pandas as pd
+import pytest
+
+from app.core.cache import Cache, FileCache, RedisCache, create_cache
+
+def test_set_and_get():
+    cache = Cache()
+    cache.set("key", "value")
+
+    assert cache.get("key") == "value"
+    assert cache.has("key") is True
+
+def test_get_missing_returns_default():
+    cache = Cache()
+
+    assert cache.get("missing") is None
+    assert cache.get("missing", default="fallback") == "fallback"
+    assert cache.has("missing") is False
+
+def test_expired_entry():
+    now = 1000.0
+    cache = Cache(timer=lambda: now)
+    cache.set("key", "value", ttl=10)
+    cache.set("forever", "value")
+
+    assert cache.get("key") == "value"
+
+    now = 1011.0
+    assert cache.get("key") is None
+    assert cache.has("key") is False
+    assert cache.get("forever") == "value"
+
+def test_least_recently_used_evicted():
+    cache = Cache(maxsize=2, shards=1)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+def test_shard_capacity_adds_up_to_maxsize():
+    for maxsize, shards in [(10_000, 16), (100, 16), (5, 16), (1, 16)]:
+        cache = Cache(maxsize=maxsize, shards=shards)
+        assert len(cache._shards) == min(maxsize, shards)
+        assert sum(store.maxsize for _, store in cache._shards) == maxsize
+
+def test_stats():
+    cache = Cache()
+    cache.set("a", 1)
+    cache.get("a")
+    cache.get("a")
+    cache.get("missing")
+
+    assert cache.stats == {"hits": 2, "misses": 1, "size": 1}
+
+def test_delete_and_clear():
+    cache = Cache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    cache.clear()
+    assert cache.get("b") is None
+
+def test_concurrent_writers():
+    cache = Cache()
+
+    def writer(offset):
+        for i in range(500):
+            cache.set(f"key-{offset}-{i}", i)
+
+    threads = [threading.Thread(target=writer, args=(t,)) for t in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(cache.get(f"key-{t}-499") == 499 for t in range(8))
+
+def test_get_or_set_loads_once_for_concurrent_misses():
+    cache = Cache()
+    loads = []
+
+    def loader():
+        loads.append(1)
+        time.sleep(0.05)
+        return "value"
+
+    threads = [threading.Thread(target=cache.get_or_set, args=("key", loader)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(loads) == 1
+    assert cache.get_or_set("key", loader) == "value"
+
+def test_file_cache_set_and_get(tmp_path):
+    cache = FileCache(directory=str(tmp_path))
+    df = pd.DataFrame({"a": [1, 2]})
+    cache.set("dataset", {"players": df})
+
+    loaded = cache.get("dataset")
+    pd.testing.assert_frame_equal(loaded["players"], df)
+
+    # A second instance (another worker, or after a restart) sees the same entry
+    assert FileCache(directory=str(tmp_path)).has("dataset") is True
+
+def test_file_cache_expired_entry(tmp_path, monkeypatch):
+    cache = FileCache(directory=str(tmp_path))
+    now = 1000.0
+    monkeypatch.setattr("app.core.cache.time.time", lambda: now)
+    cache.set("key", "value", ttl=10)
+
+    now = 1011.0
+    assert cache.get("key") is None
+    assert list(tmp_path.iterdir()) == []
+
+def test_file_cache_delete_and_clear(tmp_path):
+    cache = FileCache(directory=str(tmp_path))
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    cache.delete("a")
+    cache.delete("missing")
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+    cache.clear()
+    assert cache.get("b") is None
+
+@pytest.mark.asyncio
+async def test_async_get_and_set(tmp_path):
+    for cache in (Cache(), FileCache(directory=str(tmp_path))):
+        await cache.aset("key", {"value": 1}, ttl=60)
+
+        assert await cache.aget("key") == {"value": 1}
+        assert await cache.aget("missing", default="fallback") == "fallback"
+
+def test_file_cache_failed_write_leaves_no_temp_file(tmp_path):
+    cache = FileCache(directory=str(tmp_path))
+    cache.set("key", lambda: "unpicklable")
+
+    assert cache.get("key") is None
+    assert list(tmp_path.iterdir()) == []
+
+    (tmp_path / "left.pkl.1.2.tmp").write_bytes(b"partial")
+    cache.clear()
+    assert list(tmp_path.iterdir()) == []
+
+def test_file_cache_get_or_set_holds_lock_file(tmp_path):
+    cache = FileCache(directory=str(tmp_path))
+    lock_path = cache._path("key", "lock")
+
+    def loader():
+        assert os.path.exists(lock_path)
+        return "value"
+
+    assert cache.get_or_set("key", loader) == "value"
+    assert not os.path.exists(lock_path)
+
+def test_file_cache_takes_over_stale_lock(tmp_path, monkeypatch):
+    cache = FileCache(directory=str(tmp_path))
+    lock_path = cache._path("key", "lock")
+    with open(lock_path, "wb") as f:
+        f.write(b"crashed-worker")
+    os.utime(lock_path, (0, 0))
+
+    assert cache.get_or_set("key", lambda: 1) == 1
+    assert not os.path.exists(lock_path)
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.expiries = {}
+
+    def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return False
+        self.store[key] = value
+        self.expiries[key] = ex
+        return True
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [k for k in self.store if k.startswith(prefix)]
+
+def test_redis_cache():
+    client = FakeRedis()
+    cache = RedisCache(client=client)
+    cache.set("a", {"value": 1}, ttl=60)
+    cache.set("b", 2)
+    client.store["other:key"] = b"untouched"
+
+    assert cache.get("a") == {"value": 1}
+    assert client.expiries["nba-cache:a"] == 60
+    assert client.expiries["nba-cache:b"] is None
+
+    cache.delete("a")
+    assert cache.get("a") is None
+
+    cache.clear()
+    assert cache.get("b") is None
+    assert "other:key" in client.store
+
+def test_redis_cache_failures_return_default():
+    client = FakeRedis()
+    cache = RedisCache(client=client)
+    client.store["nba-cache:a"] = b"not a pickle"
+
+    assert cache.get("a", default="fallback") == "fallback"
+
+    cache.set("b", lambda: "unpicklable")
+    assert "nba-cache:b" not in client.store
+
+    def fail(*args, **kwargs):
+        raise ConnectionError("redis down")
+    client.delete = fail
+    client.scan_iter = fail
+    cache.delete("a")
+    cache.clear()
+
+def test_redis_get_or_set_takes_and_releases_lock():
+    client = FakeRedis()
+    cache = RedisCache(client=client)
+
+    assert cache.get_or_set("a", lambda: {"value": 1}, ttl=60) == {"value": 1}
+    assert client.expiries["nba-cache:lock:a"] == RedisCache.LOCK_TTL
+    assert "nba-cache:lock:a" not in client.store
+    assert cache.get("a") == {"value": 1}
+
+def test_redis_lock_held_by_another_worker(monkeypatch):
+    client = FakeRedis()
+    cache = RedisCache(client=client)
+    client.store["nba-cache:lock:a"] = b"other-worker"
+    monkeypatch.setattr(RedisCache, "LOCK_TTL", 0)
+
+    # Gives up waiting once the lock would have expired, and leaves the other worker's lock alone
+    assert cache.get_or_set("a", lambda: 1) == 1
+    assert client.store["nba-cache:lock:a"] == b"other-worker"
+
+def test_create_cache_backends(tmp_path, monkeypatch):
+    monkeypatch.setenv("CACHE_BACKEND", "file")
+    monkeypatch.setenv("CACHE_DIR", str(tmp_path))
+    assert isinstance(create_cache(), FileCache)
+
+    monkeypatch.setenv("CACHE_BACKEND", "memory")
+    assert isinstance(create_cache(), Cache)
@@ -0,0 +1,65 @@
+from datetime import date
+import pytest
+
+from app.core.settings import NBASettings, Settings
+from app.services.storage.s3_storage import S3Storage, _shared_s3_client
+
+def test_current_season_after_october():
+    day = date(2024, 11, 2).toordinal()
+    assert NBASettings.get_current_season(day_ordinal=day) == "2024-25"
+
+def test_current_season_before_october():
+    day = date(2025, 3, 15).toordinal()
+    assert NBASettings.get_current_season(day_ordinal=day) == "2024-25"
+
+def test_current_season_new_century():
+    day = date(2099, 10, 1).toordinal()
+    assert NBASettings.get_current_season(day_ordinal=day) == "2099-00"
+
+def test_season_list(monkeypatch):
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2023-24"))
+
+    assert NBASettings.get_season_list(num_seasons=3) == ["2023-24", "2022-23", "2021-22"]
+
+def test_season_list_returns_fresh_list(monkeypatch):
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2023-24"))
+
+    seasons = NBASettings.get_season_list(num_seasons=2)
+    seasons.append("1999-00")
+
+    assert NBASettings.get_season_list(num_seasons=2) == ["2023-24", "2022-23"]
+
+@pytest.fixture
+def reset_shared_client():
+    # The patched client must not stay cached for later tests
+    _shared_s3_client.cache_clear()
+    yield
+    _shared_s3_client.cache_clear()
+
+def test_s3_storage_uses_environment_bucket(monkeypatch, reset_shared_client):
+    monkeypatch.setenv("STORAGE_TYPE", "s3")
+    monkeypatch.setenv("S3_NBA_DATA_BUCKET_NAME", "my-bucket")
+    monkeypatch.setenv("ENVIRONMENT", "prod")
+    monkeypatch.setattr("app.services.storage.s3_storage.boto3.client", lambda *a, **k: object())
+
+    settings = Settings()
+
+    assert isinstance(settings.storage, S3Storage)
+    assert settings.storage.s3_bucket == "my-bucket-prod"
+
+def test_storage_save_formats_from_environment(monkeypatch):
+    monkeypatch.setenv("STORAGE_TYPE", "local")
+    monkeypatch.setenv("STORAGE_SAVE_FORMATS", "parquet, JSON")
+
+    settings = Settings()
+
+    assert settings.storage.formats == ("parquet", "json")
+
+def test_default_seasons_follow_current_season(monkeypatch):
+    nba_settings = NBASettings()
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2023-24"))
+    assert nba_settings.DEFAULT_SEASON == "2023-24"
+
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2024-25"))
+    assert nba_settings.DEFAULT_SEASON == "2024-25"
+    assert nba_settings.DEFAULT_SEASONS_LIST == ["2024-25", "2023-24", "2022-23"]
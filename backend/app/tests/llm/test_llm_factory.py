@@ -0,0 +1,39 @@
+import pytest
+
+from app.services.llm.llm_factory import cacheable_system_message, get_llm
+
+def test_cacheable_system_message_anthropic(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "anthropic")
+
+    message = cacheable_system_message("You are an NBA analyst.")
+
+    assert message.content == [{"type": "text", "text": "You are an NBA analyst.", "cache_control": {"type": "ephemeral"}}]
+
+def test_cacheable_system_message_openai(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+
+    message = cacheable_system_message("You are an NBA analyst.")
+
+    assert message.content == "You are an NBA analyst."
+
+def test_get_llm_unsupported_provider(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "unknown")
+
+    with pytest.raises(ValueError, match="Unsupported LLM provider: unknown"):
+        get_llm()
+
+def test_get_llm_reuses_client(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "ollama")
+
+    assert get_llm() is get_llm()
+
+def test_get_llm_follows_provider_change(monkeypatch):
+    monkeypatch.setenv("LLM_PROVIDER", "ollama")
+    ollama = get_llm()
+
+    monkeypatch.setenv("LLM_PROVIDER", "unknown")
+    with pytest.raises(ValueError, match="Unsupported LLM provider: unknown"):
+        get_llm()
+
+    monkeypatch.setenv("LLM_PROVIDER", "ollama")
+    assert get_llm() is ollama
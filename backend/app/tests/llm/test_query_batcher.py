@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+
+from app.services.llm.query_batcher import QueryBatcher
+
+def make_recording_handler():
+    """Return a handler that echoes questions upper-cased and records each batch it receives."""
+    batches = []
+
+    async def handler(questions):
+        batches.append(list(questions))
+        return [q.upper() for q in questions]
+
+    return handler, batches
+
+@pytest.mark.asyncio
+async def test_concurrent_questions_share_a_batch():
+    handler, batches = make_recording_handler()
+    batcher = QueryBatcher(handler=handler, max_batch_size=8, max_wait_ms=20)
+
+    answers = await asyncio.gather(*(batcher.submit(q) for q in ["a", "b", "c"]))
+
+    assert answers == ["A", "B", "C"]
+    assert batches == [["a", "b", "c"]]
+
+@pytest.mark.asyncio
+async def test_batch_flushes_at_max_size():
+    handler, batches = make_recording_handler()
+    batcher = QueryBatcher(handler=handler, max_batch_size=2, max_wait_ms=1000)
+
+    answers = await asyncio.gather(*(batcher.submit(q) for q in ["a", "b", "c", "d"]))
+
+    assert answers == ["A", "B", "C", "D"]
+    assert batches == [["a", "b"], ["c", "d"]]
+
+@pytest.mark.asyncio
+async def test_duplicate_questions_are_coalesced():
+    handler, batches = make_recording_handler()
+    batcher = QueryBatcher(handler=handler)
+
+    answers = await asyncio.gather(batcher.submit("a", key="k"), batcher.submit("a", key="k"))
+
+    assert answers == ["A", "A"]
+    assert batches == [["a"]]
+
+@pytest.mark.asyncio
+async def test_per_question_exception():
+    async def handler(questions):
+        return [ValueError("bad") if q == "b" else q for q in questions]
+
+    batcher = QueryBatcher(handler=handler)
+
+    results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    assert results[0] == "a"
+    assert isinstance(results[1], ValueError)
+
+@pytest.mark.asyncio
+async def test_handler_exception_fails_whole_batch():
+    async def handler(questions):
+        raise RuntimeError("LLM error")
+
+    batcher = QueryBatcher(handler=handler)
+
+    results = await asyncio.gather(batcher.submit("a"), batcher.submit("b"), return_exceptions=True)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+@pytest.mark.asyncio
+async def test_cancelled_batch_does_not_leave_pending():
+    started = asyncio.Event()
+
+    async def handler(questions):
+        started.set()
+        await asyncio.sleep(10)
+        return questions
+
+    batcher = QueryBatcher(handler=handler, max_wait_ms=1)
+
+    first = asyncio.ensure_future(batcher.submit("a"))
+    await started.wait()
+    for task in asyncio.all_tasks():
+        if task is not asyncio.current_task() and task is not first:
+            task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    assert batcher._pending == {}
@@ -0,0 +1,432 @@
+import asyncio
+import threading
+
+import pandas as pd
+import pytest
+
+from app.core.cache import cache
+from app.core.settings import NBASettings
+from app.services.llm import query_processor
+from app.services.llm.llm_factory import get_provider
+from app.services.llm.query_processor import (
+    ERROR_ANSWER,
+    NO_DATA_ANSWER,
+    QueryAnalysis,
+    QueryProcessor,
+    analysis_system_message,
+    answer_system_message,
+    select_answer_columns,
+)
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+class FakeLLM:
+    """Stands in for a LangChain chat model, recording the messages it receives."""
+    def __init__(self, analysis=None, answer="LeBron averaged 25 points", raw="not json"):
+        self.analysis = analysis or QueryAnalysis(intent="player_stats", players=["LeBron James"])
+        self.raw = raw
+        self.answer = answer
+        self.calls = []
+        self.batch_sizes = []
+        self.structured_outputs = 0
+
+    def with_structured_output(self, schema, include_raw=False):
+        llm = self
+        llm.structured_outputs += 1
+
+        class StructuredLLM:
+            def invoke(self, messages):
+                llm.calls.append(messages)
+                if isinstance(llm.analysis, Exception):
+                    return {"raw": FakeResponse(llm.raw), "parsed": None, "parsing_error": llm.analysis}
+                return {"raw": "{}", "parsed": llm.analysis, "parsing_error": None}
+
+            async def ainvoke(self, messages):
+                return self.invoke(messages)
+
+            def batch(self, inputs, config=None, return_exceptions=False):
+                llm.batch_sizes.append(len(inputs))
+                return [self.invoke(messages) for messages in inputs]
+
+            async def abatch(self, inputs, config=None, return_exceptions=False):
+                return self.batch(inputs, config, return_exceptions)
+
+        return StructuredLLM()
+
+    def invoke(self, messages):
+        self.calls.append(messages)
+        return FakeResponse(self.answer)
+
+    async def ainvoke(self, messages):
+        return self.invoke(messages)
+
+    def batch(self, inputs, config=None, return_exceptions=False):
+        self.batch_sizes.append(len(inputs))
+        results = []
+        for messages in inputs:
+            try:
+                results.append(self.invoke(messages))
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                results.append(e)
+        return results
+
+    async def abatch(self, inputs, config=None, return_exceptions=False):
+        return self.batch(inputs, config, return_exceptions)
+
+    def stream(self, messages):
+        self.calls.append(messages)
+        for word in self.answer.split(" "):
+            yield FakeResponse(word + " ")
+
+    async def astream(self, messages):
+        self.calls.append(messages)
+        for word in self.answer.split(" "):
+            yield FakeResponse(word + " ")
+
+class FakeStorage:
+    def __init__(self, dataset=None):
+        self.dataset = dataset or {}
+
+    def load(self, prefix, latest_only, names=None):
+        return self.dataset
+
+PLAYER_DATA = {
+    "player": pd.DataFrame({
+        "PLAYER_NAME": ["LeBron James", "Stephen Curry"],
+        "PTS_PER_GAME": [25.0, 27.0],
+        "season": ["2023-24", "2023-24"],
+    })
+}
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    llm = FakeLLM(analysis=QueryAnalysis(intent="player_stats", players=["LeBron James"], seasons=["2023-24"]))
+    monkeypatch.setattr(query_processor, "get_llm", lambda: llm)
+    return llm
+
+def test_analysis_uses_static_system_message(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+
+    processor._analyze_query("How many points does LeBron average?")
+
+    messages = fake_llm.calls[0]
+    assert messages[0] is analysis_system_message(NBASettings.get_current_season(), get_provider())
+    assert "How many points does LeBron average?" in messages[1].content
+
+def test_analysis_system_message_follows_current_season(fake_llm, monkeypatch):
+    processor = QueryProcessor(storage=FakeStorage())
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2024-25"))
+    processor._analyze_query("Who leads the league in assists?")
+
+    monkeypatch.setattr(NBASettings, "get_current_season", staticmethod(lambda day_ordinal=None: "2025-26"))
+    processor._analyze_query("Who leads the league in blocks?")
+
+    old_prompt, new_prompt = fake_llm.calls[0][0].content, fake_llm.calls[1][0].content
+    assert "assume current season (2024-25)" in old_prompt
+    assert "assume current season (2025-26)" in new_prompt
+    assert "Available seasons: 2025-26, 2024-25, 2023-24" in new_prompt
+
+def test_analysis_system_message_follows_provider(fake_llm, monkeypatch):
+    processor = QueryProcessor(storage=FakeStorage())
+    monkeypatch.setenv("LLM_PROVIDER", "anthropic")
+    processor._analyze_query("Who leads the league in assists?")
+
+    monkeypatch.setenv("LLM_PROVIDER", "ollama")
+    processor._analyze_query("Who leads the league in blocks?")
+
+    anthropic_prompt, ollama_prompt = fake_llm.calls[0][0].content, fake_llm.calls[1][0].content
+    assert anthropic_prompt[0]["cache_control"] == {"type": "ephemeral"}
+    assert isinstance(ollama_prompt, str)
+
+def test_structured_output_built_once(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+
+    processor._analyze_query("How many points does LeBron average?")
+    processor.batch_query(["LeBron points?", "LeBron scoring?"])
+
+    assert fake_llm.structured_outputs == 1
+
+def test_repeated_question_analyzed_once(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+
+    first = processor._analyze_query("How many points does LeBron average?")
+    second = processor._analyze_query("  how many points does LeBron average? ")
+
+    assert second == first
+    assert len(fake_llm.calls) == 1
+
+def test_batch_query_skips_cached_analyses(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+    processor._analyze_query("LeBron points?")
+
+    processor.batch_query(["LeBron points?", "LeBron scoring?"])
+
+    # only the uncached question goes to the analysis batch, both get answered
+    assert fake_llm.batch_sizes == [1, 2]
+
+def test_default_analysis_not_cached(monkeypatch):
+    llm = FakeLLM(analysis=ValueError("Invalid json output"))
+    monkeypatch.setattr(query_processor, "get_llm", lambda: llm)
+    processor = QueryProcessor(storage=FakeStorage())
+
+    processor._analyze_query("Who is the GOAT?")
+    processor._analyze_query("Who is the GOAT?")
+
+    assert len(llm.calls) == 2
+
+def test_analysis_defaults_to_current_season(monkeypatch):
+    llm = FakeLLM(analysis=QueryAnalysis(intent="player_stats", players=["LeBron James"]))
+    monkeypatch.setattr(query_processor, "get_llm", lambda: llm)
+    processor = QueryProcessor(storage=FakeStorage())
+
+    analysis = processor._analyze_query("How many points does LeBron average?")
+
+    assert analysis.seasons == [query_processor.nba_settings.DEFAULT_SEASON]
+
+def test_analysis_parse_error_returns_default(monkeypatch):
+    llm = FakeLLM(analysis=ValueError("Invalid json output"))
+    monkeypatch.setattr(query_processor, "get_llm", lambda: llm)
+    processor = QueryProcessor(storage=FakeStorage())
+
+    analysis = processor._analyze_query("Who is the GOAT?")
+
+    assert analysis.intent == "general"
+    assert analysis.seasons == [query_processor.nba_settings.DEFAULT_SEASON]
+    assert analysis.players == []
+
+def test_analysis_parse_error_recovers_plain_json(monkeypatch):
+    raw = '{"intent": "team_stats", "teams": ["Los Angeles Lakers"], "seasons": ["2023-24"]}'
+    llm = FakeLLM(analysis=ValueError("No tool call"), raw=raw)
+    monkeypatch.setattr(query_processor, "get_llm", lambda: llm)
+    processor = QueryProcessor(storage=FakeStorage())
+
+    analysis = processor._analyze_query("How did the Lakers do?")
+
+    assert analysis.intent == "team_stats"
+    assert analysis.teams == ["Los Angeles Lakers"]
+
+def test_query_success(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    answer = processor.query("How many points does LeBron average?")
+
+    assert answer == "LeBron averaged 25 points"
+    system, context, data = fake_llm.calls[-1][:3]
+    assert system is answer_system_message(get_provider())
+    assert "Players mentioned: LeBron James" in context.content
+    assert "LeBron James" in data.content
+    assert "Stephen Curry" not in data.content
+
+def test_answer_system_message_follows_provider(fake_llm, monkeypatch):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+    monkeypatch.setenv("LLM_PROVIDER", "anthropic")
+    processor.query("How many points does LeBron average?")
+    anthropic_prompt = fake_llm.calls[-1][0].content
+
+    monkeypatch.setenv("LLM_PROVIDER", "openai")
+    processor.query("How many points does LeBron average?")
+    openai_prompt = fake_llm.calls[-1][0].content
+
+    assert anthropic_prompt[0]["cache_control"] == {"type": "ephemeral"}
+    assert isinstance(openai_prompt, str)
+
+@pytest.mark.asyncio
+async def test_aquery_success(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    answer = await processor.aquery("How many points does LeBron average?")
+
+    assert answer == "LeBron averaged 25 points"
+
+def test_query_loads_data_during_analysis(fake_llm):
+    loaded = threading.Event()
+
+    class SlowStorage(FakeStorage):
+        def load(self, prefix, latest_only, names=None):
+            loaded.set()
+            return super().load(prefix, latest_only, names)
+
+    structured = fake_llm.with_structured_output(QueryAnalysis, include_raw=True)
+    overlapped = []
+
+    class WaitingStructuredLLM:
+        def invoke(self, messages):
+            # Only returns True if the dataset load started while the analysis was still running
+            overlapped.append(loaded.wait(1))
+            return structured.invoke(messages)
+
+    fake_llm.with_structured_output = lambda schema, include_raw=False: WaitingStructuredLLM()
+    processor = QueryProcessor(storage=SlowStorage(PLAYER_DATA))
+
+    answer = processor.query("How many points does LeBron average?")
+
+    assert answer == "LeBron averaged 25 points"
+    assert overlapped == [True]
+
+@pytest.mark.asyncio
+async def test_aquery_loads_data_during_analysis(fake_llm):
+    loaded = threading.Event()
+
+    class SlowStorage(FakeStorage):
+        def load(self, prefix, latest_only, names=None):
+            loaded.set()
+            return super().load(prefix, latest_only, names)
+
+    structured = fake_llm.with_structured_output(QueryAnalysis, include_raw=True)
+    overlapped = []
+
+    class WaitingStructuredLLM:
+        async def ainvoke(self, messages):
+            # Only returns True if the dataset load started while the analysis was still running
+            overlapped.append(await asyncio.to_thread(loaded.wait, 1))
+            return structured.invoke(messages)
+
+    fake_llm.with_structured_output = lambda schema, include_raw=False: WaitingStructuredLLM()
+    processor = QueryProcessor(storage=SlowStorage(PLAYER_DATA))
+
+    answer = await processor.aquery("How many points does LeBron average?")
+
+    assert answer == "LeBron averaged 25 points"
+    assert overlapped == [True]
+
+def test_stream_query(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    chunks = list(processor.stream_query("How many points does LeBron average?"))
+
+    assert chunks == ["LeBron ", "averaged ", "25 ", "points "]
+
+@pytest.mark.asyncio
+async def test_astream_query(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    chunks = [chunk async for chunk in processor.astream_query("How many points does LeBron average?")]
+
+    assert "".join(chunks) == "LeBron averaged 25 points "
+    assert len(chunks) == 4
+
+@pytest.mark.asyncio
+async def test_astream_query_no_data(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+
+    chunks = [chunk async for chunk in processor.astream_query("How many points does LeBron average?")]
+
+    assert chunks == [NO_DATA_ANSWER]
+
+def test_query_no_data(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+
+    answer = processor.query("How many points does LeBron average?")
+
+    assert answer == NO_DATA_ANSWER
+
+def test_top_performers_sample_limited_to_top_n(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+    analysis = QueryAnalysis(intent="top_performers", seasons=["2023-24"], top_n=1)
+
+    data = processor._answer_messages(analysis, PLAYER_DATA["player"])[2]
+
+    assert "LeBron James" in data.content
+    assert "Stephen Curry" not in data.content
+
+def test_answer_data_rounds_float32_stats(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+    analysis = QueryAnalysis(intent="player_stats", players=["LeBron James"], seasons=["2023-24"])
+    data = PLAYER_DATA["player"].assign(PTS_PER_GAME=pd.Series([25.3, 27.0], dtype="float32"))
+
+    message = processor._answer_messages(analysis, data)[2]
+
+    assert '"PTS_PER_GAME":25.3' in message.content
+
+def test_top_performers_query(monkeypatch):
+    llm = FakeLLM(analysis=QueryAnalysis(intent="top_performers", seasons=["2023-24"], stats=["points"], top_n=1))
+    monkeypatch.setattr(query_processor, "get_llm", lambda: llm)
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    processor.query("Who scored the most points?")
+
+    data = llm.calls[-1][2]
+    assert "Stephen Curry" in data.content
+    assert "LeBron James" not in data.content
+
+def test_unknown_intent_returns_shared_empty_data(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    data = processor._fetch_relevant_data(QueryAnalysis.model_construct(intent="general", seasons=["2023-24"]))
+
+    assert data is QueryProcessor.EMPTY_DATA
+
+def test_query_answer_error(fake_llm):
+    def failing_invoke(messages):
+        raise RuntimeError("LLM error")
+
+    fake_llm.invoke = failing_invoke
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    answer = processor.query("How many points does LeBron average?")
+
+    assert answer == ERROR_ANSWER
+
+def test_batch_query(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    answers = processor.batch_query(["LeBron points?", "LeBron scoring?", "LeBron average?"])
+
+    assert answers == ["LeBron averaged 25 points"] * 3
+    # one batch call for the analyses, one for the answers
+    assert fake_llm.batch_sizes == [3, 3]
+
+@pytest.mark.asyncio
+async def test_abatch_query_no_data(fake_llm):
+    processor = QueryProcessor(storage=FakeStorage())
+
+    answers = await processor.abatch_query(["LeBron points?", "LeBron scoring?"])
+
+    assert answers == [NO_DATA_ANSWER, NO_DATA_ANSWER]
+    # nothing to answer, so only the analysis batch is sent
+    assert fake_llm.batch_sizes == [2]
+
+def test_batch_query_answer_error(fake_llm):
+    def failing_invoke(messages):
+        raise RuntimeError("LLM error")
+
+    fake_llm.invoke = failing_invoke
+    processor = QueryProcessor(storage=FakeStorage(PLAYER_DATA))
+
+    answers = processor.batch_query(["LeBron points?"])
+
+    assert answers == [ERROR_ANSWER]
+
+STAT_COLUMNS = (
+    "PLAYER_NAME", "TEAM_ABBREVIATION", "GP", "PTS_PER_GAME", "PTS_TOTALS", "AST_PER_GAME", "AST_TOTALS",
+    "FGM_PER_GAME", "FGM_TOTALS", "FGA_PER_GAME", "FGA_TOTALS", "FG_PCT", "FG3M_TOTALS", "FG3_PCT", "season",
+)
+
+def test_select_answer_columns_keeps_requested_stats():
+    columns, columns_text = select_answer_columns(STAT_COLUMNS, ("points",), "per_game")
+
+    assert columns == ("PLAYER_NAME", "TEAM_ABBREVIATION", "PTS_PER_GAME", "season")
+    assert columns_text == "PLAYER_NAME, TEAM_ABBREVIATION, PTS_PER_GAME, season"
+
+def test_select_answer_columns_matches_stat_families():
+    columns, _ = select_answer_columns(STAT_COLUMNS, ("field goals", "assists"), "totals")
+
+    assert columns == ("PLAYER_NAME", "TEAM_ABBREVIATION", "AST_TOTALS", "FGM_TOTALS", "FGA_TOTALS", "FG_PCT", "season")
+
+def test_select_answer_columns_keeps_shot_family_apart():
+    columns, _ = select_answer_columns(STAT_COLUMNS, ("three pointers",), "totals")
+
+    assert columns == ("PLAYER_NAME", "TEAM_ABBREVIATION", "FG3M_TOTALS", "FG3_PCT", "season")
+
+def test_select_answer_columns_without_match_keeps_stats_type():
+    columns, _ = select_answer_columns(STAT_COLUMNS, (), "per_game")
+
+    assert columns == ("PLAYER_NAME", "TEAM_ABBREVIATION", "GP", "PTS_PER_GAME", "AST_PER_GAME", "FGM_PER_GAME", "FGA_PER_GAME", "FG_PCT", "FG3_PCT", "season")
@@ -1,8 +1,11 @@
+import threading
+import time
+import numpy as np
 import pandas as pd
 import pandas.testing as pdt
 import pytest
 
-from app.services.nba.nba_api_client import NBAApiClient
+from app.services.nba.nba_api_client import NBAApiClient, build_alias_index, descending_order, first_n_per_group, resolve_stat_column, stat_column_candidates
 from app.core.cache import cache
 
 COLLECTOR_PATH = "app.services.nba.nba_api_client.NBADataCollector"
@@ -11,9 +14,18 @@ COLLECTOR_PATH = "app.services.nba.nba_api_client.NBADataCollector"
 def clear_cache():
     cache.clear()
 
+# Frames shared by the collection and loading tests, none of them modify the datasets they are given
+COLLECTED_NAMES = np.array(["Player1", "Player2"], dtype=object)
+COLLECTED_PLAYERS = pd.DataFrame({"name": COLLECTED_NAMES})
+
+STORED_DATASET = {
+    "players": pd.DataFrame({"name": ["PlayerA", "PlayerB"]}),
+    "teams": pd.DataFrame({"team": ["TeamX", "TeamY"]})
+}
+
 def make_fake_collector(dataset=None):
     """Return a FakeCollector class (not instance) so NBAApiClient can call it."""
-    default = {"players": pd.DataFrame({"name": ["Player1", "Player2"]})}
+    default = {"players": COLLECTED_PLAYERS}
 
     class FakeCollector:
         def collect_dataset(self, seasons=None):
@@ -34,7 +46,7 @@ def make_fake_storage(initial_load=None, save_result=True):
             self.saved = {"dataset": dataset, "prefix": prefix}
             return self._save_result
 
-        def load(self, prefix, latest_only):
+        def load(self, prefix, latest_only, names=None):
             return self._load_value
 
     return FakeStorage()
@@ -52,64 +64,47 @@ def test_collect_and_store_dataset_success(monkeypatch):
     assert fake_storage.saved["prefix"] == "test-prefix"
 
     saved_df = fake_storage.saved["dataset"]["players"]
-    expected_df = pd.DataFrame({"name": ["Player1", "Player2"]})
-    pdt.assert_frame_equal(saved_df.reset_index(drop=True), expected_df.reset_index(drop=True))
-
-def test_collect_and_store_dataset_no_data(monkeypatch):
-    collector = make_fake_collector(dataset={})
-    monkeypatch.setattr(COLLECTOR_PATH, collector)
-
-    fake_storage = make_fake_storage()
-    client = NBAApiClient(storage=fake_storage)
-    success = client.collect_and_store_dataset(seasons=["2023-24"], prefix="test-prefix")
-
-    assert success is False
-
-def test_setup_dataset_success(monkeypatch):
-    collector = make_fake_collector()
-    monkeypatch.setattr(COLLECTOR_PATH, collector)
-
-    fake_storage = make_fake_storage()
-    client = NBAApiClient(storage=fake_storage)
-    success = client.setup_nba_dataset(seasons=["2022-23"], prefix="nba-test")
+    assert saved_df.columns.tolist() == ["name"]
+    assert np.array_equal(saved_df["name"].to_numpy(), COLLECTED_NAMES)
 
-    assert success is True
-
-def test_setup_dataset_failure(monkeypatch):
+def test_collect_and_store_dataset_reuses_collector(monkeypatch):
     collector = make_fake_collector()
+    instances = []
+    monkeypatch.setattr(COLLECTOR_PATH, lambda: instances.append(collector()) or instances[-1])
+
+    client = NBAApiClient(storage=make_fake_storage())
+    client.collect_and_store_dataset(seasons=["2023-24"])
+    client.collect_and_store_dataset(seasons=["2024-25"])
+
+    assert len(instances) == 1
+
+class BadCollector:
+    def collect_dataset(self, seasons=None):
+        raise RuntimeError("Collection error")
+
+@pytest.mark.parametrize("dataset,save_result,expected", [
+    (None, True, True),
+    ({}, True, False),
+    (None, False, False),
+    ("RAISE", True, False),
+], ids=["ok", "empty", "save_fail", "exc"])
+def test_setup_dataset(monkeypatch, dataset, save_result, expected):
+    collector = BadCollector if dataset == "RAISE" else make_fake_collector(dataset)
     monkeypatch.setattr(COLLECTOR_PATH, collector)
 
-    fake_storage = make_fake_storage(save_result=False)
-    client = NBAApiClient(storage=fake_storage)
-    success = client.setup_nba_dataset(seasons=["2022-23"], prefix="nba-test")
-
-    assert success is False
-
-def test_setup_dataset_exception(monkeypatch):
-    class BadCollector:
-        def collect_dataset(self, seasons=None):
-            raise RuntimeError("Collection error")
-
-    monkeypatch.setattr(COLLECTOR_PATH, BadCollector)
-
-    fake_storage = make_fake_storage(save_result=False)
-    client = NBAApiClient(storage=fake_storage)
+    client = NBAApiClient(storage=make_fake_storage(save_result=save_result))
     success = client.setup_nba_dataset(seasons=["2022-23"], prefix="nba-test")
 
-    assert success is False
+    assert success is expected
 
 def test_load_data_success():
-    expected_data = {
-        "players": pd.DataFrame({"name": ["PlayerA", "PlayerB"]}),
-        "teams": pd.DataFrame({"team": ["TeamX", "TeamY"]})
-    }
-    fake_storage = make_fake_storage(initial_load=expected_data)
+    fake_storage = make_fake_storage(initial_load=STORED_DATASET)
     client = NBAApiClient(storage=fake_storage)
 
     loaded_data = client.load_data(prefix="nba-data", latest_only=True)
 
-    assert loaded_data == expected_data
-    assert client.cached_data == expected_data
+    assert loaded_data == STORED_DATASET
+    assert client.cached_data == STORED_DATASET
 
 def test_load_data_no_data():
     fake_storage = make_fake_storage(initial_load={})
@@ -122,7 +117,7 @@ def test_load_data_no_data():
 
 def test_load_data_exception():
     class BadStorage:
-        def load(self, prefix, latest_only):
+        def load(self, prefix, latest_only, names=None):
             raise RuntimeError("Load error")
 
     fake_storage = BadStorage()
@@ -131,4 +126,312 @@ def test_load_data_exception():
     loaded_data = client.load_data(prefix="nba-data", latest_only=True)
 
     assert loaded_data == {}
-    assert client.cached_data == {}
\ No newline at end of file
+    assert client.cached_data == {}
+
+PLAYER_STATS = pd.DataFrame({
+    "PLAYER_NAME": ["LeBron James", "Stephen Curry", "Seth Curry", "Anthony Davis"],
+    "PTS": [25.7, 26.4, 9.2, 24.7],
+    "season": ["2023-24", "2023-24", "2023-24", "2023-24"],
+})
+
+TEAM_STATS = pd.DataFrame({
+    "TEAM_NAME": ["Los Angeles Lakers", "Golden State Warriors", "Los Angeles Clippers"],
+    "W": [47, 46, 51],
+    "season": ["2023-24", "2023-24", "2023-24"],
+})
+
+def test_build_alias_index():
+    index = build_alias_index(["LeBron James", "Stephen Curry", "Seth Curry"])
+
+    assert index["lebron"] == "LeBron James"
+    assert index["lebron james"] == "LeBron James"
+    assert index["stephen"] == "Stephen Curry"
+    # "curry" is ambiguous, so it is not an alias
+    assert "curry" not in index
+
+def test_get_player_stats_resolves_aliases():
+    fake_storage = make_fake_storage(initial_load={"player": PLAYER_STATS})
+    client = NBAApiClient(storage=fake_storage)
+
+    result = client.get_player_stats(players=["LeBron", "stephen curry", "Unknown Player"], seasons=["2023-24"])
+
+    assert result["PLAYER_NAME"].tolist() == ["LeBron James", "Stephen Curry"]
+
+def test_get_team_stats_resolves_aliases():
+    fake_storage = make_fake_storage(initial_load={"team": TEAM_STATS})
+    client = NBAApiClient(storage=fake_storage)
+
+    result = client.get_team_stats(teams=["Warriors", "Lakers"], seasons=["2023-24"])
+
+    assert set(result["TEAM_NAME"]) == {"Los Angeles Lakers", "Golden State Warriors"}
+
+def test_get_team_stats_filters_season():
+    fake_storage = make_fake_storage(initial_load={"team": TEAM_STATS})
+    client = NBAApiClient(storage=fake_storage)
+
+    result = client.get_team_stats(teams=["Lakers"], seasons=["2022-23"])
+
+    assert result.empty
+
+def test_lowered_names_built_once_per_dataset():
+    fake_storage = make_fake_storage(initial_load={"player": PLAYER_STATS})
+    client = NBAApiClient(storage=fake_storage)
+
+    client.get_player_stats(players=["LeBron James"], seasons=["2023-24"])
+    lowered = client.lowered_names("player", "PLAYER_NAME")
+    client.get_player_stats(players=["Anthony Davis"], seasons=["2023-24"])
+
+    assert client.lowered_names("player", "PLAYER_NAME") is lowered
+    assert lowered.tolist() == ["lebron james", "stephen curry", "seth curry", "anthony davis"]
+
+def test_load_data_stores_names_as_categoricals():
+    fake_storage = make_fake_storage(initial_load={"player": PLAYER_STATS})
+    client = NBAApiClient(storage=fake_storage)
+
+    loaded = client.load_data(downcast=False)
+
+    assert isinstance(loaded["player"]["PLAYER_NAME"].dtype, pd.CategoricalDtype)
+    assert PLAYER_STATS["PLAYER_NAME"].dtype == object
+    pdt.assert_frame_equal(loaded["player"].astype({"PLAYER_NAME": object}), PLAYER_STATS)
+
+def test_get_player_stats_loads_only_player_dataset():
+    class FilteringStorage:
+        def __init__(self):
+            self.requested = []
+
+        def load(self, prefix, latest_only, names=None):
+            self.requested.append(names)
+            dataset = {"player": PLAYER_STATS, "players": pd.DataFrame({"name": ["LeBron James"]})}
+            return {name: df for name, df in dataset.items() if names is None or name in names}
+
+    storage = FilteringStorage()
+    client = NBAApiClient(storage=storage)
+
+    client.get_player_stats(players=["LeBron James"], seasons=["2023-24"])
+    client.get_player_stats(players=["Anthony Davis"], seasons=["2023-24"])
+
+    assert storage.requested == [["player"]]
+    assert list(client.cached_data) == ["player"]
+    assert cache.get("dataset:nba-data:latest:player") is not None
+
+def test_load_data_downcasts_numeric_columns():
+    stats = pd.DataFrame({"PTS": [25.7, 29.5], "GP": [71, 74], "PLAYER_ID": [2544, 2**40]})
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": stats}))
+
+    downcast = client.load_data()["player"]
+    full_precision = client.load_data(downcast=False)["player"]
+
+    assert downcast.dtypes.tolist() == [np.float32, np.int32, np.int64]
+    pdt.assert_frame_equal(full_precision, stats)
+
+def test_load_data_reads_shared_cache_once(monkeypatch):
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": PLAYER_STATS}))
+    client.load_data()
+    shared_reads = []
+    monkeypatch.setattr(cache, "get", lambda key, default=None: shared_reads.append(key))
+
+    loaded = client.load_data()
+
+    assert loaded is client.cached_data
+    assert shared_reads == []
+
+def test_concurrent_cold_loads_read_storage_once():
+    class SlowStorage:
+        def __init__(self):
+            self.loads = 0
+
+        def load(self, prefix, latest_only, names=None):
+            self.loads += 1
+            time.sleep(0.05)
+            return {"player": PLAYER_STATS}
+
+    storage = SlowStorage()
+    clients = [NBAApiClient(storage=storage) for _ in range(4)]
+    threads = [threading.Thread(target=client.load_data) for client in clients]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert storage.loads == 1
+    assert all("player" in client.cached_data for client in clients)
+
+def test_overlapping_entity_loads_read_each_dataset_once():
+    class SlowStorage:
+        def __init__(self):
+            self.requested = []
+
+        def load(self, prefix, latest_only, names=None):
+            self.requested.extend(names)
+            time.sleep(0.05)
+            dataset = {"player": PLAYER_STATS, "team": pd.DataFrame({"TEAM_NAME": ["Lakers"], "season": ["2023-24"]})}
+            return {name: dataset[name] for name in names}
+
+    storage = SlowStorage()
+    clients = [NBAApiClient(storage=storage) for _ in range(2)]
+    threads = [
+        threading.Thread(target=clients[0].load_data, kwargs={"entities": ["player"]}),
+        threading.Thread(target=clients[1].load_data, kwargs={"entities": ["player", "team"]}),
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(storage.requested) == ["player", "team"]
+    assert list(clients[1].cached_data) == ["player", "team"]
+
+def test_collect_and_store_clears_loaded_data(monkeypatch):
+    monkeypatch.setattr(COLLECTOR_PATH, make_fake_collector({"player_stats": PLAYER_STATS}))
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": PLAYER_STATS}))
+    client.get_player_stats(players=["LeBron James"], seasons=["2023-24"])
+    client.load_data()
+
+    assert client.collect_and_store_dataset(seasons=["2023-24"]) is True
+
+    assert client.cached_data == {}
+    assert cache.get("dataset:nba-data:latest") is None
+    assert cache.get("dataset:nba-data:latest:player") is None
+
+def test_ingest_in_another_process_refreshes_loaded_data(monkeypatch):
+    monkeypatch.setattr(COLLECTOR_PATH, make_fake_collector({"player_stats": PLAYER_STATS}))
+    monkeypatch.setattr("app.services.nba.nba_api_client.DATASET_VERSION_CHECK_INTERVAL", 0)
+    fake_storage = make_fake_storage(initial_load={"player": PLAYER_STATS})
+    ingesting, serving = NBAApiClient(storage=fake_storage), NBAApiClient(storage=fake_storage)
+    assert len(serving.get_player_stats(players=["LeBron James"], seasons=["2023-24"])) == 1
+
+    fake_storage._load_value = {"player": PLAYER_STATS[PLAYER_STATS["PLAYER_NAME"] != "LeBron James"]}
+    assert ingesting.collect_and_store_dataset(seasons=["2023-24"]) is True
+
+    assert serving.get_player_stats(players=["LeBron James"], seasons=["2023-24"]).empty
+
+def test_lowered_names_reset_on_new_dataset():
+    fake_storage = make_fake_storage(initial_load={"player": PLAYER_STATS})
+    client = NBAApiClient(storage=fake_storage)
+    client.get_player_stats(players=["LeBron James"], seasons=["2023-24"])
+
+    cache.clear()
+    fake_storage._load_value = {"player": PLAYER_STATS.iloc[:1]}
+    client.load_data()
+
+    assert client.lowered_names("player", "PLAYER_NAME").tolist() == ["lebron james"]
+
+def test_reader_holding_old_frame_uses_its_own_index():
+    fake_storage = make_fake_storage(initial_load={"player": PLAYER_STATS})
+    client = NBAApiClient(storage=fake_storage)
+    old_df = client.get_dataset("player")
+
+    # Reloaded by an ingest while a query still holds the old frame
+    client.clear_cached_data("nba-data", ["player"])
+    fake_storage._load_value = {"player": PLAYER_STATS.iloc[:1]}
+    client.get_player_stats(players=["LeBron James"], seasons=["2023-24"])
+
+    rows = client._select_rows("player", old_df, ["Anthony Davis"], ["2023-24"], "PLAYER_NAME", "season")
+    assert rows["PLAYER_NAME"].tolist() == ["Anthony Davis"]
+    assert client.row_index("player", "PLAYER_NAME").keys() == {("lebron james", "2023-24")}
+
+def test_get_player_stats_keeps_dataset_order_across_seasons():
+    stats = pd.DataFrame({
+        "PLAYER_NAME": ["LeBron James", "Stephen Curry", "LeBron James"],
+        "PTS": [28.9, 29.5, 25.7],
+        "season": ["2022-23", "2022-23", "2023-24"],
+    })
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": stats}))
+
+    result = client.get_player_stats(players=["LeBron James", "lebron james"], seasons=["2023-24", "2022-23"])
+
+    assert result["PTS"].tolist() == pytest.approx([28.9, 25.7])
+
+def test_row_index_built_once_per_dataset():
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": PLAYER_STATS}))
+
+    client.get_player_stats(players=["LeBron James"], seasons=["2023-24"])
+    index = client.row_index("player", "PLAYER_NAME")
+    client.get_player_stats(players=["Seth Curry"], seasons=["2023-24"])
+
+    assert client.row_index("player", "PLAYER_NAME") is index
+    assert index[("seth curry", "2023-24")].tolist() == [2]
+
+TOP_PLAYER_STATS = pd.DataFrame({
+    "PLAYER_NAME": ["LeBron James", "Stephen Curry", "Anthony Davis", "LeBron James", "Stephen Curry"],
+    "PTS_PER_GAME": [25.7, 26.4, 24.7, 28.9, 29.5],
+    "PTS_TOTALS": [1822, 1956, 1881, 1590, 1648],
+    "season": ["2023-24", "2023-24", "2023-24", "2022-23", "2022-23"],
+}, index=[0, 1, 2, 0, 1])
+
+def test_resolve_stat_column():
+    columns = TOP_PLAYER_STATS.columns
+
+    assert resolve_stat_column("points", "per_game", columns) == "PTS_PER_GAME"
+    assert resolve_stat_column("Points", "totals", columns) == "PTS_TOTALS"
+    assert resolve_stat_column("player name", "per_game", columns) == "PLAYER_NAME"
+    assert resolve_stat_column("assists", "per_game", columns) is None
+
+def test_stat_column_candidates_memoized():
+    stat_column_candidates.cache_clear()
+
+    assert stat_column_candidates("points", "totals") == ("PTS_TOTALS", "PTS")
+    assert stat_column_candidates("points", "totals") is stat_column_candidates("points", "totals")
+    assert stat_column_candidates.cache_info().hits == 2
+
+def test_get_top_players_per_season():
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": TOP_PLAYER_STATS}))
+
+    result = client.get_top_players(seasons=["2023-24", "2022-23"], stat="points", top_n=2)
+
+    assert result["PLAYER_NAME"].tolist() == ["Stephen Curry", "LeBron James", "Stephen Curry", "LeBron James"]
+    assert result["season"].tolist() == ["2023-24", "2023-24", "2022-23", "2022-23"]
+
+# Shot columns as the joined LeagueDash per-game and totals frame names them
+SHOOTING_STATS = pd.DataFrame({
+    "PLAYER_NAME": ["Stephen Curry", "Nikola Jokic", "Luka Doncic"],
+    "FGM_PER_GAME": [8.8, 10.4, 11.5],
+    "FGA_PER_GAME": [19.5, 17.9, 23.6],
+    "FG_PCT": [0.45, 0.583, 0.487],
+    "FG3M_PER_GAME": [4.8, 1.1, 4.1],
+    "FG3A_PER_GAME": [11.8, 3.0, 10.6],
+    "FG3_PCT": [0.408, 0.359, 0.382],
+    "FTM_PER_GAME": [4.4, 4.5, 6.5],
+    "FTA_PER_GAME": [4.9, 5.5, 8.7],
+    "FT_PCT": [0.923, 0.817, 0.786],
+    "season": ["2023-24"] * 3,
+})
+
+@pytest.mark.parametrize("stat,leader", [
+    ("field goals", "Luka Doncic"),
+    ("three pointers", "Stephen Curry"),
+    ("3 pointers", "Stephen Curry"),
+    ("free throws", "Luka Doncic"),
+])
+def test_get_top_players_shot_stats(stat, leader):
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": SHOOTING_STATS}))
+
+    result = client.get_top_players(seasons=["2023-24"], stat=stat, top_n=1)
+
+    assert result["PLAYER_NAME"].tolist() == [leader]
+
+def test_get_top_players_unknown_stat():
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": TOP_PLAYER_STATS}))
+
+    assert client.get_top_players(seasons=["2023-24"], stat="assists").empty
+
+def test_descending_order():
+    values = np.array([3.0, 1.0, 9.0, np.nan, 5.0, 5.0])
+
+    # the tie keeps position order, NaN is left out
+    assert descending_order(values).tolist() == [2, 4, 5, 0, 1]
+
+def test_first_n_per_group():
+    codes = np.array([1, 0, 1, 1, 0])
+
+    assert first_n_per_group(codes, top_n=2).tolist() == [1, 4, 0, 2]
+
+def test_get_top_players_reuses_stat_order():
+    client = NBAApiClient(storage=make_fake_storage(initial_load={"player": TOP_PLAYER_STATS}))
+
+    client.get_top_players(seasons=["2023-24"], stat="points", top_n=1)
+    order = client.stat_order("player", "PTS_PER_GAME")
+    result = client.get_top_players(seasons=["2022-23"], stat="points", top_n=1)
+
+    assert client.stat_order("player", "PTS_PER_GAME") is order
+    assert result["PLAYER_NAME"].tolist() == ["Stephen Curry"]
@@ -0,0 +1,201 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.services.nba.nba_data_collector import NBADataCollector, RequestRateLimiter, concat_nonempty, merge_per_game_and_totals, narrow_integers, _all_players_df
+
+def test_collect_dataset_fetches_seasons_concurrently(monkeypatch):
+    collector = NBADataCollector()
+    # Every season's requests wait for the others to start, which only completes if they run at the same time
+    barrier = threading.Barrier(2, timeout=1)
+
+    def player_stats(season):
+        barrier.wait()
+        return pd.DataFrame({"PLAYER_NAME": ["LeBron James"], "season": [season]})
+
+    monkeypatch.setattr(collector, "get_all_players_season_stats", player_stats)
+    monkeypatch.setattr(collector, "get_team_stats", lambda season: pd.DataFrame({"TEAM_NAME": ["Lakers"], "season": [season]}))
+    monkeypatch.setattr(collector, "get_all_players", lambda: pd.DataFrame())
+    monkeypatch.setattr(collector, "get_all_teams", lambda: pd.DataFrame())
+
+    dataset = collector.collect_dataset(seasons=["2022-23", "2023-24"])
+
+    assert dataset["player_stats"]["season"].tolist() == ["2022-23", "2023-24"]
+    assert dataset["team_stats"]["season"].tolist() == ["2022-23", "2023-24"]
+
+def test_collect_dataset_skips_empty_seasons(monkeypatch):
+    collector = NBADataCollector()
+    monkeypatch.setattr(collector, "get_all_players_season_stats", lambda season: pd.DataFrame())
+    monkeypatch.setattr(collector, "get_team_stats", lambda season: pd.DataFrame())
+    monkeypatch.setattr(collector, "get_all_players", lambda: pd.DataFrame())
+    monkeypatch.setattr(collector, "get_all_teams", lambda: pd.DataFrame())
+
+    dataset = collector.collect_dataset(seasons=["2023-24"])
+
+    assert "player_stats" not in dataset
+    assert "team_stats" not in dataset
+
+def test_merge_per_game_and_totals():
+    per_game = pd.DataFrame({"PLAYER_ID": [3, 1, 2], "PLAYER_NAME": ["C", "A", "B"], "GP": [10, 20, 30], "PTS": [1.5, 2.0, 3.0]})
+    totals = pd.DataFrame({"PLAYER_ID": [1, 3], "PLAYER_NAME": ["A", "C"], "GP": [20, 10], "PTS": [40.0, 15.0]})
+
+    merged = merge_per_game_and_totals(per_game, totals, ["PLAYER_ID", "PLAYER_NAME"])
+
+    # rows in per-game order and only where both frames have the player, GP is the same in both so it is kept once
+    expected = pd.DataFrame({
+        "PLAYER_ID": [3, 1],
+        "PLAYER_NAME": ["C", "A"],
+        "GP": [10, 20],
+        "PTS_PER_GAME": [1.5, 2.0],
+        "PTS_TOTALS": [15.0, 40.0],
+    })
+    pd.testing.assert_frame_equal(merged, expected)
+
+def test_merge_per_game_and_totals_keeps_matching_missing_values_once():
+    per_game = pd.DataFrame({"TEAM_ID": [1, 2], "TEAM_NAME": ["A", "B"], "W_PCT": [0.5, None], "PTS": [110.0, 99.0]})
+    totals = pd.DataFrame({"TEAM_ID": [1, 2], "TEAM_NAME": ["A", "B"], "W_PCT": [0.5, None], "PTS": [9020.0, 8118.0]})
+
+    merged = merge_per_game_and_totals(per_game, totals, ["TEAM_ID", "TEAM_NAME"])
+
+    assert merged.columns.tolist() == ["TEAM_ID", "TEAM_NAME", "W_PCT", "PTS_PER_GAME", "PTS_TOTALS"]
+
+def test_merge_per_game_and_totals_rejects_duplicate_keys():
+    per_game = pd.DataFrame({"PLAYER_ID": [1, 1], "PLAYER_NAME": ["A", "A"], "PTS": [1.0, 2.0]})
+    totals = pd.DataFrame({"PLAYER_ID": [1], "PLAYER_NAME": ["A"], "PTS": [30.0]})
+
+    with pytest.raises(pd.errors.MergeError, match="per-game"):
+        merge_per_game_and_totals(per_game, totals, ["PLAYER_ID", "PLAYER_NAME"])
+
+def test_narrow_integers():
+    df = pd.DataFrame({"PLAYER_ID": [1629029, 2544], "GP": [70, 71], "BIG": [2**40, 1], "PTS": [25.5, 27.1]})
+
+    narrowed = narrow_integers(df)
+
+    assert narrowed.dtypes.to_dict() == {"PLAYER_ID": np.int32, "GP": np.int32, "BIG": np.int64, "PTS": np.float64}
+    assert narrowed["PLAYER_ID"].tolist() == [1629029, 2544]
+
+def test_concat_nonempty():
+    frames = [pd.DataFrame({"season": ["2022-23"]}), pd.DataFrame({"season": ["2023-24"]})]
+
+    assert concat_nonempty(frames)["season"].tolist() == ["2022-23", "2023-24"]
+    assert concat_nonempty([]).empty
+
+def test_past_season_stats_are_read_from_cache(tmp_path, monkeypatch):
+    collector = NBADataCollector(cache_dir=str(tmp_path))
+    calls = []
+
+    def fetch(season):
+        calls.append(season)
+        return pd.DataFrame({"PLAYER_NAME": ["LeBron James"], "season": [season]})
+
+    monkeypatch.setattr(collector, "_fetch_players_season_stats", fetch)
+
+    first = collector.get_all_players_season_stats("2019-20")
+    second = collector.get_all_players_season_stats("2019-20")
+
+    assert calls == ["2019-20"]
+    pd.testing.assert_frame_equal(first, second)
+
+def test_uncacheable_season_stats_are_still_returned(tmp_path, monkeypatch):
+    collector = NBADataCollector(cache_dir=str(tmp_path))
+    # Mixed types in one column, Arrow refuses to write it
+    frame = pd.DataFrame({"PLAYER_NAME": ["LeBron James", "Stephen Curry"], "NOTE": [1, "x"], "season": ["2019-20", "2019-20"]})
+    monkeypatch.setattr(collector, "_fetch_players_season_stats", lambda season: frame)
+
+    result = collector.get_all_players_season_stats("2019-20")
+
+    pd.testing.assert_frame_equal(result, frame)
+    assert list(tmp_path.iterdir()) == []
+
+def test_current_season_stats_are_always_fetched(tmp_path, monkeypatch):
+    collector = NBADataCollector(cache_dir=str(tmp_path))
+    calls = []
+    monkeypatch.setattr("app.services.nba.nba_data_collector.nba_settings.get_current_season", lambda: "2024-25")
+
+    def fetch(season):
+        calls.append(season)
+        return pd.DataFrame({"TEAM_NAME": ["Lakers"], "season": [season]})
+
+    monkeypatch.setattr(collector, "_fetch_team_stats", fetch)
+
+    collector.get_team_stats("2024-25")
+    collector.get_team_stats("2024-25")
+
+    assert calls == ["2024-25", "2024-25"]
+    assert list(tmp_path.iterdir()) == []
+
+def test_player_season_comparison_data_keeps_compared_columns(monkeypatch):
+    collector = NBADataCollector(cache_dir=None)
+    season_stats = pd.DataFrame({
+        "PLAYER_ID": [1, 2, 3],
+        "PLAYER_NAME": ["A", "B", "C"],
+        "TEAM_ID": [10, 10, 20],
+        "TEAM_ABBREVIATION": ["LAL", "LAL", "BOS"],
+        "PTS_PER_GAME": [25.0, 10.0, 20.0],
+        "PTS_TOTALS": [2000.0, 800.0, 1600.0],
+        "season": ["2023-24"] * 3,
+    })
+    monkeypatch.setattr(collector, "get_all_players_season_stats", lambda season: season_stats)
+
+    comparison = collector.get_player_season_comparison_data(["A", "C"], seasons=["2023-24"], stat_cols=["PTS_PER_GAME"])
+
+    assert comparison.columns.tolist() == ["PLAYER_ID", "PLAYER_NAME", "TEAM_ID", "TEAM_ABBREVIATION", "PTS_PER_GAME", "season"]
+    assert comparison["PLAYER_NAME"].tolist() == ["A", "C"]
+
+def test_static_players_are_built_once(monkeypatch):
+    calls = []
+
+    def get_players():
+        calls.append(1)
+        return [{"id": 2544, "full_name": "LeBron James"}]
+
+    monkeypatch.setattr("app.services.nba.nba_data_collector.players.get_players", get_players)
+    _all_players_df.cache_clear()
+    collector = NBADataCollector(cache_dir=None)
+
+    first = collector.get_all_players()
+    first["extra"] = 1
+    second = collector.get_all_players()
+    _all_players_df.cache_clear()
+
+    assert len(calls) == 1
+    assert second.columns.tolist() == ["id", "full_name"]
+
+def test_rate_limiter_spaces_calls_across_threads():
+    limiter = RequestRateLimiter(min_interval=0.05)
+    starts = []
+    lock = threading.Lock()
+
+    def call():
+        limiter.wait()
+        with lock:
+            starts.append(time.monotonic())
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    starts.sort()
+    assert all(later - earlier >= 0.045 for earlier, later in zip(starts, starts[1:]))
+
+def test_league_dash_requests_wait_for_rate_limiter(monkeypatch):
+    collector = NBADataCollector(cache_dir=None)
+    events = []
+    monkeypatch.setattr(collector.rate_limiter, "wait", lambda: events.append("wait"))
+
+    class FakeEndpoint:
+        def __init__(self, **params):
+            events.append(params["per_mode_detailed"])
+
+        def get_data_frames(self):
+            return [pd.DataFrame({"TEAM_ID": [1], "TEAM_NAME": ["Lakers"], "W": [47]})]
+
+    monkeypatch.setattr("app.services.nba.nba_data_collector.leaguedashteamstats.LeagueDashTeamStats", FakeEndpoint)
+
+    collector.get_team_stats("2019-20")
+
+    assert events == ["wait", "PerGame", "wait", "Totals"]
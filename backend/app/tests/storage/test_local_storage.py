@@ -1,32 +1,38 @@
 import logging
 import os
 import io
-import time
 import pandas as pd
 import pytest
 
 from ...services.storage.local_storage import LocalStorage
 
+EMPTY_DF = pd.DataFrame({"a": pd.array([], dtype="float64")})
+
 def make_df():
     return pd.DataFrame({
         "A": [1, 2],
         "B": ["x", "y"]
     })
 
-def create_load_files(base_path):
+def write_csv(path, text):
+    """ Write a small csv fixture as plain text, load parses it back with pandas """
+    with open(path, "w") as f:
+        f.write(text)
+
+def create_load_files(base_path, monkeypatch):
+    """ Two csv files for the dataset "players", returns the modification times load sees, keyed by path """
     pfx_dir = os.path.join(base_path, "pfx")
     os.makedirs(pfx_dir, exist_ok=True)
 
-    # create two csv files for same dataset name "players"
     path1 = os.path.join(pfx_dir, "players_old.csv")
     path2 = os.path.join(pfx_dir, "players_new.csv")
-    pd.DataFrame({"a": [1]}).to_csv(path1, index=False)
-    pd.DataFrame({"a": [2]}).to_csv(path2, index=False)
+    write_csv(path1, "a\n1\n")
+    write_csv(path2, "a\n2\n")
 
-    # set mod times so path2 is newer
-    now = time.time()
-    os.utime(path1, (now - 100, now - 100))
-    os.utime(path2, (now, now))
+    # path2 is newer, files added by a test register their own time
+    mtimes = {path1: 100.0, path2: 200.0}
+    monkeypatch.setattr(os.path, "getmtime", mtimes.__getitem__)
+    return mtimes
 
 def test_save_and_load(tmp_path):
     base = str(tmp_path)
@@ -40,13 +46,29 @@ def test_save_and_load(tmp_path):
     dirpath = os.path.join(base, prefix)
     files = os.listdir(dirpath)
 
-    assert any(f.startswith("players_") and f.endswith(".csv") for f in files)
-    assert any(f.startswith("players_") and f.endswith(".json") for f in files)
+    assert any(f.startswith("players_") and f.endswith(".parquet") for f in files)
+    assert not any(f.endswith(".json") for f in files)
 
     loaded = storage.load(prefix=prefix, latest_only=True)
     assert "players" in loaded
     pd.testing.assert_frame_equal(loaded["players"].reset_index(drop=True), dataset["players"].reset_index(drop=True))
 
+def test_save_configured_formats(tmp_path):
+    storage = LocalStorage(base_directory=str(tmp_path), formats=("parquet", "csv"))
+
+    assert storage.save(dataset={"players": make_df()}, prefix="formats") is True
+
+    extensions = sorted(os.path.splitext(f)[1] for f in os.listdir(os.path.join(str(tmp_path), "formats")))
+    assert extensions == [".csv", ".parquet"]
+
+def test_unknown_save_format(tmp_path):
+    with pytest.raises(ValueError):
+        LocalStorage(base_directory=str(tmp_path), formats=("xml",))
+
+def test_save_formats_without_loadable_format(tmp_path):
+    with pytest.raises(ValueError, match="can't be loaded back"):
+        LocalStorage(base_directory=str(tmp_path), formats=("json",))
+
 def test_load_no_directory(tmp_path):
     base = str(tmp_path)
     storage = LocalStorage(base_directory=base)
@@ -60,7 +82,7 @@ def test_save_skips_empty_df(tmp_path):
     storage = LocalStorage(base_directory=base)
     prefix = "empty-data"
 
-    dataset = { "players": pd.DataFrame() }
+    dataset = { "players": EMPTY_DF }
     ok = storage.save(dataset=dataset, prefix=prefix)
     assert ok is True
 
@@ -84,9 +106,21 @@ def test_failed_save(tmp_path, monkeypatch):
     ok = storage.save(dataset=dataset, prefix=prefix)
     assert ok is False
 
-def test_load_latest(tmp_path):
+def test_load_prefers_newer_parquet_over_csv(tmp_path, monkeypatch):
+    base = str(tmp_path)
+    mtimes = create_load_files(base_path=base, monkeypatch=monkeypatch)
+    parquet_path = os.path.join(base, "pfx", "players_newest.parquet")
+    pd.DataFrame({"a": [3]}).to_parquet(parquet_path, index=False)
+    mtimes[parquet_path] = 300.0
+
+    storage = LocalStorage(base_directory=base)
+
+    res = storage.load(prefix="pfx", latest_only=True)
+    assert int(res["players"]["a"].iloc[0]) == 3
+
+def test_load_latest(tmp_path, monkeypatch):
     base = str(tmp_path)
-    create_load_files(base_path=base)
+    create_load_files(base_path=base, monkeypatch=monkeypatch)
 
     storage = LocalStorage(base_directory=base)
 
@@ -95,9 +129,21 @@ def test_load_latest(tmp_path):
     assert "players" in res_latest
     assert int(res_latest["players"]["a"].iloc[0]) == 2
     
+def test_load_only_requested_names(tmp_path, monkeypatch):
+    base = str(tmp_path)
+    mtimes = create_load_files(base_path=base, monkeypatch=monkeypatch)
+    teams_path = os.path.join(base, "pfx", "teams_new.csv")
+    write_csv(teams_path, "b\n1\n")
+    mtimes[teams_path] = 300.0
+
+    storage = LocalStorage(base_directory=base)
+
+    res = storage.load(prefix="pfx", latest_only=True, names=["teams"])
+    assert list(res) == ["teams"]
+
 def test_load_all(tmp_path, monkeypatch):
     base = str(tmp_path)
-    create_load_files(base_path=base)
+    create_load_files(base_path=base, monkeypatch=monkeypatch)
 
     storage = LocalStorage(base_directory=base)
     
@@ -113,7 +159,8 @@ def test_load_catch_exception(tmp_path, monkeypatch, caplog):
     dirpath = os.path.join(base, prefix)
     os.makedirs(dirpath, exist_ok=True)
     csv_path = os.path.join(dirpath, "players_20250101_000000.csv")
-    pd.DataFrame({"a": [1]}).to_csv(csv_path, index=False)
+    # Never parsed, read_csv is made to fail below
+    open(csv_path, "w").close()
 
     storage = LocalStorage(base_directory=base)
 
@@ -127,4 +174,18 @@ def test_load_catch_exception(tmp_path, monkeypatch, caplog):
     result = storage.load(prefix=prefix, latest_only=True)
 
     assert result == {}
-    assert "Failed to load data from local" in caplog.text
\ No newline at end of file
+    assert "Failed to load data from local" in caplog.text
+
+def test_load_first_skips_modification_times(tmp_path, monkeypatch):
+    base = str(tmp_path)
+    create_load_files(base_path=base, monkeypatch=monkeypatch)
+    storage = LocalStorage(base_directory=base)
+
+    def fail_getmtime(path):
+        raise AssertionError("modification time read")
+
+    monkeypatch.setattr("os.listdir", lambda d: ["players_old.csv", "players_new.csv"])
+    monkeypatch.setattr("os.path.getmtime", fail_getmtime)
+
+    res = storage.load(prefix="pfx", latest_only=False)
+    assert int(res["players"]["a"].iloc[0]) == 1
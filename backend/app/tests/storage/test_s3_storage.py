@@ -1,16 +1,24 @@
 import io
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime
 import pandas as pd
 import logging
 import pytest
 
-from app.services.storage.s3_storage import S3Storage
+from app.services.storage.s3_storage import S3Storage, _shared_s3_client
 
 S3_CLIENT_PATH = "app.services.storage.s3_storage.boto3.client"
 
+@pytest.fixture(autouse=True)
+def reset_shared_client():
+    # Every test installs its own fake client
+    _shared_s3_client.cache_clear()
+    yield
+    _shared_s3_client.cache_clear()
+
 class FakeS3Client:
     def __init__(self):
-        # store put_object calls as dict[(Bucket,Key)] = bytes
+        # store uploaded objects as dict[(Bucket,Key)] = bytes
         self.store = {}
         self.list_response = {}
         self.get_map = {}
@@ -23,6 +31,9 @@ class FakeS3Client:
             content = Body
         self.store[(Bucket, Key)] = content
 
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None):
+        self.store[(Bucket, Key)] = Fileobj.read()
+
     def list_objects_v2(self, Bucket, Prefix):
         return self.list_response
 
@@ -31,63 +42,61 @@ class FakeS3Client:
             raise Exception("NoSuchKey")
         return {"Body": io.BytesIO(self.get_map[(Bucket, Key)])}
     
-def make_csv_bytes(df):
-    return df.to_csv(index=False).encode("utf-8")
-
-def create_load_files(monkeypatch):
+@pytest.fixture
+def fake_s3(monkeypatch):
+    """ Fake client every S3Storage built in the test talks to """
     fake = FakeS3Client()
-    now = datetime.now()
-    t_old = now - timedelta(seconds=100)
-    t_new = now
+    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
+    return fake
+
+# Stored CSV payloads the loader parses back into {"val": [1]} and {"val": [2]}, for the tests that download
+CSV_V1 = b"val\n1\n"
+CSV_V2 = b"val\n2\n"
+
+# Fixed LastModified times, T_NEW is 100 seconds after T_OLD
+T_OLD = datetime(2024, 1, 1, 0, 0, 0)
+T_NEW = datetime(2024, 1, 1, 0, 1, 40)
+
+EMPTY_DF = pd.DataFrame({"a": pd.array([], dtype="float64")})
+
+def stub_file_reads(monkeypatch):
+    """ Skip parsing in tests that only check which key is picked, each loaded frame holds its key """
+    monkeypatch.setattr(S3Storage, "_read_file", lambda self, key: pd.DataFrame({"key": [key]}))
 
+def create_load_files(fake):
+    """ Listing of an older and a newer players file, their reads are stubbed by the tests using it """
     fake.list_response = {
         "Contents": [
-            {"Key": "pfx/players_old.csv", "LastModified": t_old},
-            {"Key": "pfx/players_new.csv", "LastModified": t_new},
+            {"Key": "pfx/players_old.csv", "LastModified": T_OLD},
+            {"Key": "pfx/players_new.csv", "LastModified": T_NEW},
         ]
     }
 
-    csv_old = make_csv_bytes(pd.DataFrame({"val": [1]}))
-    csv_new = make_csv_bytes(pd.DataFrame({"val": [2]}))
-    fake.get_map[("b", "pfx/players_old.csv")] = csv_old
-    fake.get_map[("b", "pfx/players_new.csv")] = csv_new
-
-    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
-
-def test_save_success(monkeypatch):
-    fake = FakeS3Client()
-    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
-
+def test_save_success(fake_s3):
     storage = S3Storage(s3_bucket="my-bucket")
     ok = storage.save({"players": pd.DataFrame({"a": [1]})}, prefix="pfx")
     assert ok is True
 
-    # confirm csv and json keys were created in store
-    keys = [k for (b, k) in fake.store.keys() if b == "my-bucket"]
-    assert any(k.endswith(".csv") and "players" in k for k in keys)
-    assert any(k.endswith(".json") and "players" in k for k in keys)
-
-def test_save_skips_empty_df(monkeypatch):
-    fake = FakeS3Client()
-    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
+    # only the parquet key is written by default
+    keys = [k for (b, k) in fake_s3.store.keys() if b == "my-bucket"]
+    assert len(keys) == 1
+    assert keys[0].endswith(".parquet") and "players" in keys[0]
 
+def test_save_skips_empty_df(fake_s3):
     storage = S3Storage(s3_bucket="my-bucket")
-    ok = storage.save({"players": pd.DataFrame({"a": []})}, prefix="pfx")
+    ok = storage.save({"players": EMPTY_DF}, prefix="pfx")
     assert ok is True
-    assert len(fake.store) == 0
-
-def test_save_not_configured(monkeypatch):
-    fake = FakeS3Client()
-    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
+    assert len(fake_s3.store) == 0
 
+def test_save_not_configured(fake_s3):
     storage = S3Storage(s3_bucket=None)
     ok = storage.save({"players": pd.DataFrame({"a": [1]})}, prefix="pfx")
     assert ok is False
-    assert len(fake.store) == 0
+    assert len(fake_s3.store) == 0
 
 def test_fail_save_exception(monkeypatch):
     class FailingS3Client(FakeS3Client):
-        def put_object(self, Bucket, Key, Body):
+        def upload_fileobj(self, Fileobj, Bucket, Key, Config=None):
             raise Exception("Simulated failure")
 
     fake = FailingS3Client()
@@ -105,10 +114,8 @@ def test_load_not_configured(caplog):
     assert res == {}
     assert "S3 client or bucket not configured" in caplog.text
 
-def test_load_no_objects(monkeypatch, caplog):
-    fake = FakeS3Client()
-    fake.list_response = {"KeyCount": 0}
-    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
+def test_load_no_objects(fake_s3, caplog):
+    fake_s3.list_response = {"KeyCount": 0}
 
     bucket = "my-bucket"
     prefix = "pfx"
@@ -119,27 +126,34 @@ def test_load_no_objects(monkeypatch, caplog):
     assert res == {}
     assert f"No objects found in S3 bucket {bucket} with prefix {prefix}." in caplog.text
 
-def test_load_latest(monkeypatch):
-    create_load_files(monkeypatch)
+def test_load_latest(fake_s3, monkeypatch):
+    create_load_files(fake_s3)
+    stub_file_reads(monkeypatch)
 
     storage = S3Storage(s3_bucket="b")
     res = storage.load(prefix="pfx", latest_only=True)
-    assert "players" in res
-    df = res["players"]
 
-    assert len(df) == 1
-    assert df["val"].iloc[0] == 2
+    assert res["players"]["key"].tolist() == ["pfx/players_new.csv"]
+
+def test_save_then_load_parquet(fake_s3):
+    storage = S3Storage(s3_bucket="b")
+    storage.save({"players": pd.DataFrame({"val": [1, 2]})}, prefix="pfx")
+
+    parquet_key = next(k for (_, k) in fake_s3.store if k.endswith(".parquet"))
+    fake_s3.get_map[("b", parquet_key)] = fake_s3.store[("b", parquet_key)]
+    fake_s3.list_response = {"Contents": [{"Key": parquet_key, "LastModified": T_NEW}]}
+
+    res = storage.load(prefix="pfx")
+    assert res["players"]["val"].tolist() == [1, 2]
 
-def test_load_first(monkeypatch):
-    create_load_files(monkeypatch)
+def test_load_first(fake_s3, monkeypatch):
+    create_load_files(fake_s3)
+    stub_file_reads(monkeypatch)
 
     storage = S3Storage(s3_bucket="b")
     res = storage.load(prefix="pfx", latest_only=False)
-    assert "players" in res
-    df = res["players"]
 
-    assert len(df) == 1
-    assert df["val"].iloc[0] == 1
+    assert res["players"]["key"].tolist() == ["pfx/players_old.csv"]
 
 def test_fail_load_exception(monkeypatch, caplog):
     class FailingS3Client(FakeS3Client):
@@ -153,4 +167,87 @@ def test_fail_load_exception(monkeypatch, caplog):
     caplog.set_level(logging.ERROR)
     res = storage.load(prefix="pfx")
     assert res == {}
-    assert "Failed to load data from S3" in caplog.text
\ No newline at end of file
+    assert "Failed to load data from S3" in caplog.text
+
+def test_load_downloads_datasets_concurrently(fake_s3):
+    fake_s3.list_response = {
+        "Contents": [
+            {"Key": "pfx/player_1.csv", "LastModified": T_NEW},
+            {"Key": "pfx/team_1.csv", "LastModified": T_NEW},
+        ]
+    }
+    fake_s3.get_map[("b", "pfx/player_1.csv")] = CSV_V1
+    fake_s3.get_map[("b", "pfx/team_1.csv")] = CSV_V2
+
+    # Each download waits for the other to start, which only completes if they run at the same time
+    barrier = threading.Barrier(2, timeout=1)
+    get_object = fake_s3.get_object
+
+    def waiting_get_object(Bucket, Key):
+        barrier.wait()
+        return get_object(Bucket, Key)
+
+    fake_s3.get_object = waiting_get_object
+
+    res = S3Storage(s3_bucket="b").load(prefix="pfx")
+
+    assert res["player"]["val"].iloc[0] == 1
+    assert res["team"]["val"].iloc[0] == 2
+
+def test_load_follows_paginated_listing(monkeypatch):
+    class PagedS3Client(FakeS3Client):
+        def list_objects_v2(self, Bucket, Prefix, ContinuationToken=None):
+            if ContinuationToken is None:
+                return {"Contents": [{"Key": "pfx/player_1.csv", "LastModified": T_NEW}], "IsTruncated": True, "NextContinuationToken": "page-2"}
+            return {"Contents": [{"Key": "pfx/team_1.csv", "LastModified": T_NEW}], "IsTruncated": False}
+
+    fake = PagedS3Client()
+    fake.get_map[("b", "pfx/player_1.csv")] = CSV_V1
+    fake.get_map[("b", "pfx/team_1.csv")] = CSV_V2
+    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: fake)
+
+    res = S3Storage(s3_bucket="b").load(prefix="pfx")
+
+    assert sorted(res) == ["player", "team"]
+
+def test_client_pool_sized_for_download_workers(monkeypatch):
+    client_kwargs = {}
+    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: client_kwargs.update(k) or FakeS3Client())
+
+    S3Storage(s3_bucket="b")
+
+    assert client_kwargs["config"].max_pool_connections == S3Storage.LOAD_MAX_WORKERS
+
+def test_client_shared_between_instances(monkeypatch):
+    created = []
+    monkeypatch.setattr(S3_CLIENT_PATH, lambda *a, **k: created.append(FakeS3Client()) or created[-1])
+
+    first, second = S3Storage(s3_bucket="a"), S3Storage(s3_bucket="b")
+
+    assert len(created) == 1
+    assert first.s3_client is second.s3_client
+
+def test_save_uploads_objects_concurrently(fake_s3):
+    # Each upload waits for the other to start, which only completes if they run at the same time
+    barrier = threading.Barrier(2, timeout=1)
+    upload_fileobj = fake_s3.upload_fileobj
+
+    def waiting_upload_fileobj(Fileobj, Bucket, Key, Config=None):
+        barrier.wait()
+        return upload_fileobj(Fileobj, Bucket, Key, Config)
+
+    fake_s3.upload_fileobj = waiting_upload_fileobj
+
+    ok = S3Storage(s3_bucket="b", formats=("parquet", "json")).save({"players": pd.DataFrame({"val": [1]})}, prefix="pfx")
+
+    assert ok is True
+    assert sorted(k.rsplit(".", 1)[1] for (_, k) in fake_s3.store) == ["json", "parquet"]
+
+def test_load_latest_when_newest_is_listed_first(fake_s3, monkeypatch):
+    create_load_files(fake_s3)
+    stub_file_reads(monkeypatch)
+    fake_s3.list_response["Contents"].reverse()
+
+    res = S3Storage(s3_bucket="b").load(prefix="pfx", latest_only=True)
+
+    assert res["players"]["key"].tolist() == ["pfx/players_new.csv"]